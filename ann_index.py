@@ -0,0 +1,167 @@
+from __future__ import annotations
+from pathlib import Path
+import numpy as np
+
+INDEX_VERSION = 1
+
+
+def _sq_dists(x, c):
+    """Squared Euclidean distances between rows of x and rows of c."""
+    d2 = np.einsum("ij,ij->i", x, x)[:, None] + np.einsum("ij,ij->i", c, c)[None, :] - 2.0 * (x @ c.T)
+    np.maximum(d2, 0.0, out=d2)
+    return d2
+
+
+def _assign(x, c, batch: int = 8192):
+    out = np.empty(len(x), dtype=np.int32)
+    for i in range(0, len(x), batch):
+        out[i:i + batch] = np.argmin(_sq_dists(x[i:i + batch], c), axis=1)
+    return out
+
+
+def _kmeans(x, k: int, iters: int, rng):
+    """Plain Lloyd iterations; empty clusters are re-seeded from random points."""
+    k = min(k, len(x))
+    centroids = x[rng.choice(len(x), size=k, replace=False)].copy()
+    for _ in range(iters):
+        assign = _assign(x, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, x)
+        counts = np.bincount(assign, minlength=k)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        if empty.any():
+            centroids[empty] = x[rng.choice(len(x), size=int(empty.sum()), replace=False)]
+    return centroids
+
+
+class IVFPQIndex:
+    """
+    Inverted-file index with product-quantized residuals.
+
+    Vectors are clustered into nlist coarse cells. Each vector is stored in its
+    cell's inverted list as m one-byte codes of its residual to the centroid.
+    A search scans the nprobe closest cells with table lookups, then re-ranks the
+    best `rerank` candidates with exact distances against the original vectors.
+    Ids are row numbers in the gallery the index was trained on.
+    """
+
+    def __init__(self, centroids, codebooks, codes, ids, offsets, nprobe: int = 8):
+        self.centroids = centroids
+        self.codebooks = codebooks
+        self.codes = codes
+        self.ids = ids
+        self.offsets = offsets
+        self.nprobe = nprobe
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    @property
+    def ntotal(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def train(cls, vectors, nlist: int | None = None, m: int = 16, ksub: int = 256,
+              iters: int = 15, max_train: int = 65536, nprobe: int = 8, seed: int = 0):
+        x = np.ascontiguousarray(np.asarray(vectors, dtype=np.float32))
+        n, dim = x.shape
+        if dim % m:
+            raise ValueError(f"dimension {dim} is not divisible by m={m}")
+        if nlist is None:
+            nlist = int(4 * np.sqrt(n))
+        nlist = max(1, min(nlist, n))
+        rng = np.random.default_rng(seed)
+
+        sample = x if n <= max_train else x[rng.choice(n, size=max_train, replace=False)]
+        centroids = _kmeans(sample, nlist, iters, rng)
+
+        assign = _assign(x, centroids)
+        residuals = x - centroids[assign]
+
+        dsub = dim // m
+        sample_res = residuals if n <= max_train else residuals[rng.choice(n, size=max_train, replace=False)]
+        codebooks = np.stack([
+            _kmeans(np.ascontiguousarray(sample_res[:, j * dsub:(j + 1) * dsub]), ksub, iters, rng)
+            for j in range(m)
+        ])
+        # Small galleries may have fewer than ksub points per subspace
+        ksub = codebooks.shape[1]
+
+        codes = np.empty((n, m), dtype=np.uint8 if ksub <= 256 else np.uint16)
+        for j in range(m):
+            codes[:, j] = _assign(np.ascontiguousarray(residuals[:, j * dsub:(j + 1) * dsub]), codebooks[j])
+
+        order = np.argsort(assign, kind="stable")
+        offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(assign, minlength=len(centroids)))
+        return cls(centroids, codebooks, codes[order], order.astype(np.int64), offsets, nprobe=nprobe)
+
+    def search(self, queries, vectors, k: int = 1, nprobe: int | None = None, rerank: int = 32):
+        """
+        Returns (ids, distances), each shaped (num_queries, k), sorted nearest first.
+        vectors is the full-precision gallery used for the exact re-rank; missing
+        neighbours (tiny probes) are reported as id -1 with distance inf.
+        """
+        q = np.asarray(queries, dtype=np.float32).reshape(-1, self.centroids.shape[1])
+        nprobe = max(1, min(nprobe or self.nprobe, self.nlist))
+        rerank = max(k, rerank)
+        m, ksub, dsub = self.codebooks.shape
+        cols = np.arange(m) * ksub
+        cb_t = self.codebooks.transpose(0, 2, 1)
+        cb_sq = np.einsum("mkd,mkd->mk", self.codebooks, self.codebooks)
+
+        out_ids = np.full((len(q), k), -1, dtype=np.int64)
+        out_d = np.full((len(q), k), np.inf, dtype=np.float32)
+        probes = np.argpartition(_sq_dists(q, self.centroids), nprobe - 1, axis=1)[:, :nprobe]
+
+        for qi, probe in enumerate(probes):
+            starts = self.offsets[probe]
+            lengths = self.offsets[probe + 1] - starts
+            total = int(lengths.sum())
+            if total == 0:
+                continue
+            # Row numbers of every probed list, and which probe each row came from
+            owner = np.repeat(np.arange(len(probe)), lengths)
+            rows = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths - starts, lengths)
+
+            # ADC tables ||r_j - c_jk||^2 for every probed cell, subspace j and code k
+            resid = (q[qi] - self.centroids[probe]).reshape(len(probe), m, dsub).transpose(1, 0, 2)
+            tables = (np.einsum("mpd,mpd->mp", resid, resid)[:, :, None] + cb_sq[:, None, :]
+                      - 2.0 * (resid @ cb_t)).transpose(1, 0, 2).ravel()
+            flat = (owner * (m * ksub))[:, None] + cols + self.codes[rows]
+            cand_d = tables[flat].sum(axis=1)
+            cand_ids = self.ids[rows]
+            if len(cand_ids) > rerank:
+                cand_ids = cand_ids[np.argpartition(cand_d, rerank - 1)[:rerank]]
+
+            exact = np.sqrt(_sq_dists(q[qi:qi + 1], np.asarray(vectors[cand_ids], dtype=np.float32))[0])
+            top = np.argsort(exact)[:k]
+            out_ids[qi, :len(top)] = cand_ids[top]
+            out_d[qi, :len(top)] = exact[top]
+        return out_ids, out_d
+
+    def save(self, path):
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            np.savez(
+                f,
+                version=np.int64(INDEX_VERSION),
+                nprobe=np.int64(self.nprobe),
+                centroids=self.centroids,
+                codebooks=self.codebooks,
+                codes=self.codes,
+                ids=self.ids,
+                offsets=self.offsets,
+            )
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as z:
+            if int(z["version"]) != INDEX_VERSION:
+                raise ValueError(f"Unsupported ANN index version {int(z['version'])}")
+            return cls(z["centroids"], z["codebooks"], z["codes"], z["ids"], z["offsets"],
+                       nprobe=int(z["nprobe"]))
@@ -1,15 +1,16 @@
 import streamlit as st
-import cv2
-import pandas as pd
-from pathlib import Path
+import os
 from datetime import date
 import time
 
-import av
-from streamlit_webrtc import webrtc_streamer, WebRtcMode
+from db import init_db, add_user, get_users, get_attendance, cache_stats as db_cache_stats
+import metrics
+from reports import count_present, count_users, daily_headcount, user_month_summary, ensure_report
 
-from db import init_db, add_user, get_users, mark_attendance, get_attendance
-from vision import ensure_dirs, capture_images, train_encodings, load_encodings, recognize_from_frame
+# cv2, pandas, the vision stack (face_recognition/dlib models) and WebRTC are
+# imported inside the sections that use them; only the selected section runs,
+# so e.g. opening Reports never loads them. Python keeps each module (and the
+# loaded models) for the rest of the process.
 
 st.set_page_config(page_title="Face Attendance", page_icon="✅", layout="wide")
 
@@ -166,7 +167,22 @@ def inject_holo_cyber_theme():
             backdrop-filter: blur(14px);
         }
 
-        /* ====== Tabs (Neon pill tabs) ====== */
+        /* ====== Section selector (Neon pill tabs) ====== */
+        .stRadio [role="radiogroup"]{
+          gap: 8px !important;
+        }
+        .stRadio [role="radiogroup"] label{
+          border-radius: 999px !important;
+          background: rgba(0,0,0,0.18) !important;
+          border: 1px solid rgba(0,255,255,0.18) !important;
+          padding: 8px 14px !important;
+          font-weight: 800 !important;
+        }
+        .stRadio [role="radiogroup"] label:has(input:checked){
+          background: linear-gradient(90deg, rgba(0,255,255,0.14), rgba(255,0,255,0.14)) !important;
+          border: 1px solid rgba(255,0,255,0.35) !important;
+          box-shadow: 0 0 18px rgba(0,255,255,0.22), 0 0 26px rgba(255,0,255,0.14);
+        }
         .stTabs [data-baseweb="tab-list"]{
           padding: 10px 10px !important;
           gap: 8px !important;
@@ -292,7 +308,6 @@ def inject_holo_cyber_theme():
 inject_holo_cyber_theme()
 # -------------------------------------------------------------------------
 
-ensure_dirs()
 init_db()
 
 # Hero header
@@ -316,10 +331,46 @@ st.markdown("""
 
 st.write("")
 
-tabs = st.tabs(["👤 Register", "🧠 Train", "📸 Mark Attendance", "📊 Reports"])
+# ---------- Diagnostics (sidebar) ----------
+with st.sidebar:
+    st.markdown("<span class='accent'>🩺 Diagnostics</span>", unsafe_allow_html=True)
+    metrics.set_enabled(st.toggle("Collect pipeline metrics", value=metrics.enabled()))
+    snap = metrics.snapshot()
+    if snap["histograms"]:
+        import pandas as pd
+        st.dataframe(
+            pd.DataFrame(
+                [(name, h["count"], h["p50"], h["p95"], h["p99"]) for name, h in snap["histograms"].items()],
+                columns=["metric", "count", "p50", "p95", "p99"]
+            ),
+            use_container_width=True,
+            hide_index=True
+        )
+    if snap["counters"]:
+        st.json(snap["counters"])
+    if not snap["histograms"] and not snap["counters"]:
+        st.markdown("<span class='small-text'>No samples yet. Enable collection and start the camera.</span>", unsafe_allow_html=True)
+
+    cache = db_cache_stats()
+    st.markdown(
+        f"<span class='small-text'>Query cache: {cache['hits']} hits • {cache['misses']} misses • "
+        f"{cache['entries']} entries • data v{cache['data_version']}</span>",
+        unsafe_allow_html=True
+    )
+
+    dcol1, dcol2 = st.columns(2)
+    with dcol1:
+        if st.button("Export .prom"):
+            st.caption(f"Wrote {metrics.write_prometheus()}")
+    with dcol2:
+        if st.button("Reset"):
+            metrics.reset()
+
+PAGES = ["👤 Register", "🧠 Train", "📸 Mark Attendance", "📊 Reports"]
+page = st.radio("Section", PAGES, horizontal=True, key="page", label_visibility="collapsed")
 
 # ---------- Register ----------
-with tabs[0]:
+if page == PAGES[0]:
     st.subheader("Register a new user")
     col1, col2 = st.columns(2)
 
@@ -343,13 +394,22 @@ with tabs[0]:
                 st.error("Enter User ID first.")
             else:
                 st.info("Capturing... Look at the camera. Keep face centered. Good lighting helps.")
+                from vision import capture_images
                 try:
+                    capture_stats = {}
                     saved, last_rgb = capture_images(
                         user_id=user_id.strip(),
                         num_images=int(num_images),
-                        cam_index=int(cam_index)
+                        cam_index=int(cam_index),
+                        stats=capture_stats
                     )
                     st.success(f"Captured and saved {saved} images for {user_id}.")
+                    skipped = capture_stats["rejected_blur"] + capture_stats["rejected_duplicate"]
+                    if skipped:
+                        st.caption(f"Skipped {capture_stats['rejected_blur']} blurry and "
+                                   f"{capture_stats['rejected_duplicate']} near-duplicate frames.")
+                    if saved < int(num_images):
+                        st.warning("Stopped before reaching the target; move your head slightly between shots.")
                     if last_rgb is not None:
                         st.image(last_rgb, caption="Last captured frame (preview)", channels="RGB")
                 except Exception as e:
@@ -359,23 +419,77 @@ with tabs[0]:
     st.subheader("Registered Users")
     rows = get_users()
     if rows:
+        import pandas as pd
         df = pd.DataFrame(rows, columns=["user_id", "name", "created_at"])
         st.dataframe(df, use_container_width=True)
     else:
         st.write("No users registered yet.")
 
 # ---------- Train ----------
-with tabs[1]:
+elif page == PAGES[1]:
     st.subheader("Train face encodings")
     st.markdown(
-        "<span class='small-text'>This will scan <b>data/images/&lt;user_id&gt;</b> and create <b>data/encodings/encodings.pkl</b>.</span>",
+        "<span class='small-text'>This will scan <b>data/images/&lt;user_id&gt;</b> and create <b>data/encodings/gallery.bin</b>.</span>",
         unsafe_allow_html=True
     )
 
+    incremental = st.checkbox(
+        "Incremental (only encode new or changed images)", value=True,
+        help="Reuses encodings recorded in data/encodings/manifest.pkl for images that have not changed."
+    )
+    build_index = st.checkbox(
+        "Build ANN index (large galleries)", value=False,
+        help="Approximate search (IVF-PQ) with exact re-ranking. Only worth it for tens of thousands of encodings."
+    )
+
+    compact = st.checkbox(
+        "Compact gallery to a few prototypes per user", value=False,
+        help="Keeps representative encodings (medoids) per user plus one for a distinct look such as glasses."
+    )
+    prototypes = st.number_input("Prototypes per user", min_value=1, max_value=10, value=3, step=1, disabled=not compact)
+
+    quant = st.selectbox(
+        "Gallery storage", ["float32", "float16", "int8"], index=0,
+        help="float16/int8 scan a 2x/4x smaller copy and re-rank the best candidates exactly."
+    )
+
+    workers = st.number_input("Worker processes", min_value=1, max_value=64, value=os.cpu_count() or 1, step=1)
+
     if st.button("Train Now"):
-        with st.spinner("Training encodings..."):
-            stats = train_encodings()
-        st.success("Training complete!")
+        import pandas as pd
+        from vision import train_encodings
+        from registry import get_registry
+        progress_bar = st.progress(0.0, text="Scanning images...")
+        per_user_box = st.empty()
+        last_draw = [0.0]
+
+        def on_progress(p):
+            # Redrawing on every image would dominate small jobs; cap at ~4 updates/s
+            now = time.time()
+            if p["done"] < p["total"] and now - last_draw[0] < 0.25:
+                return
+            last_draw[0] = now
+            eta = f"{p['eta_sec']:.0f}s" if p["eta_sec"] is not None else "-"
+            progress_bar.progress(
+                p["done"] / p["total"],
+                text=f"{p['done']}/{p['total']} images • {p['images_per_sec']:.1f} img/s • ETA {eta}"
+            )
+            per_user_box.dataframe(
+                pd.DataFrame(
+                    [(uid, d, t) for uid, (d, t) in p["per_user"].items()],
+                    columns=["user_id", "encoded", "to_encode"]
+                ),
+                use_container_width=True
+            )
+
+        stats = train_encodings(
+            build_index=build_index, incremental=incremental, workers=int(workers), progress=on_progress,
+            prototypes=int(prototypes) if compact else None, quant=None if quant == "float32" else quant
+        )
+        progress_bar.progress(1.0, text="Done")
+        # Live streams in every session switch to the new gallery on their next frame
+        snap = get_registry().reload()
+        st.success(f"Training complete! Gallery v{snap.version} is live." if snap else "Training complete!")
         st.json(stats)
 
     st.markdown(
@@ -384,38 +498,101 @@ with tabs[1]:
     )
 
 # ---------- Mark Attendance (WEBRTC / BROWSER CAMERA) ----------
-with tabs[2]:
+elif page == PAGES[2]:
     st.subheader("Live webcam recognition → mark attendance (Browser Camera)")
-    known = load_encodings()
+    import cv2
+    import av
+    from streamlit_webrtc import webrtc_streamer, WebRtcMode
+    from vision import recognize_from_frame
+    from registry import get_registry
+    from tracking import FaceTracker
+    from live import LatestFrameWorker
+    from scaling import ScaleController
+    from recorder import get_recorder
+
+    registry = get_registry()
+    snap = registry.current()
 
     tol = st.slider("Recognition strictness (lower = stricter)", 0.30, 0.60, 0.45, 0.01)
+    use_tracking = st.toggle("Tracking mode (detect every N frames)", value=True)
+    detect_every = st.slider("Re-detect every N frames", 1, 30, 10, 1, disabled=not use_tracking)
+    use_adaptive = st.toggle("Adaptive detection scale", value=False)
+    budget_ms = st.slider("Per-frame latency budget (ms)", 20, 300, 80, 10, disabled=not use_adaptive)
     run = st.toggle("Start Camera")
 
-    if known is None:
+    if snap is None:
         st.warning("No encodings found. Please go to 🧠 Train tab and train first.")
         st.stop()
 
+    # The matcher is built once per gallery version and shared by all sessions
+    index = snap.matcher.index
+    nprobe = None
+    if index is not None and index.nlist > 1:
+        nprobe = st.slider("ANN search width (cells probed)", 1, min(64, index.nlist), min(index.nprobe, index.nlist))
+    st.caption(f"Gallery v{snap.version} • {snap.size} encodings")
+
     status_placeholder = st.empty()
 
     # Map user_id -> name
     user_map = {uid: nm for uid, nm, _ in get_users()}
 
-    if "last_mark_time" not in st.session_state:
-        st.session_state.last_mark_time = 0.0
-    if "last_mark_label" not in st.session_state:
-        st.session_state.last_mark_label = None
-    if "last_marked" not in st.session_state:
-        st.session_state.last_marked = None
+    # Plain objects shared with the worker thread; it never touches session_state
+    if "mark_status" not in st.session_state:
+        st.session_state.mark_status = {"time": 0.0, "label": None, "marked": None}
+    mark_status = st.session_state.mark_status
+
+    # One tracker per session
+    if "tracker" not in st.session_state:
+        st.session_state.tracker = FaceTracker(snap.matcher)
+    tracker = st.session_state.tracker
+    tracker.tolerance = float(tol)
+    tracker.detect_every = int(detect_every)
+
+    if "scale_controller" not in st.session_state:
+        st.session_state.scale_controller = ScaleController()
+    controller = st.session_state.scale_controller if use_adaptive else None
+    if controller:
+        controller.budget_ms = float(budget_ms)
+    tracker.controller = controller
+
+    def recognize(img):
+        # One snapshot per frame: a gallery swapped in mid-frame applies from the next one
+        snap = registry.current()
+        if snap is None:
+            return []
+        matcher = snap.matcher.with_nprobe(nprobe) if nprobe else snap.matcher
+        if use_tracking:
+            tracker.set_matcher(matcher, version=snap.version)
+            return tracker.process(img)
+        return recognize_from_frame(img, matcher, tolerance=float(tol), controller=controller)
+
+    recorder = get_recorder()
+
+    def mark_results(results):
+        now = time.time()
+        for label, _ in results:
+            if label != "Unknown" and now - mark_status["time"] > 1.5:
+                nm = user_map.get(label, "Unknown Name")
+                marked = recorder.mark(label, nm)
+                mark_status.update(time=now, label=f"{label} - {nm}", marked=bool(marked))
+
+    # Recognition and SQLite writes run on a background worker fed with the
+    # newest frame only; the WebRTC callback just draws the latest results.
+    # Its thread runs only while frames arrive (see LatestFrameWorker)
+    if "recognition_worker" not in st.session_state:
+        st.session_state.recognition_worker = LatestFrameWorker(recognize, on_result=mark_results)
+    worker = st.session_state.recognition_worker
+    worker.recognize = recognize
+    worker.on_result = mark_results
 
     RTC_CONFIG = {"iceServers": [{"urls": ["stun:stun.l.google.com:19302"]}]}
 
     # NOTE: Removed av.VideoFrame type hints to avoid NameError issues on some setups
     def video_frame_callback(frame):
         img = frame.to_ndarray(format="bgr24")
-        results = recognize_from_frame(img, known, tolerance=float(tol))
+        worker.submit(img.copy())
 
-        now = time.time()
-        for label, (top, right, bottom, left) in results:
+        for label, (top, right, bottom, left) in worker.latest():
             cv2.rectangle(
                 img,
                 (left, top),
@@ -429,12 +606,6 @@ with tabs[2]:
                 nm = user_map.get(label, "Unknown Name")
                 display = f"{label} - {nm}"
 
-                if now - st.session_state.last_mark_time > 1.5:
-                    marked = mark_attendance(label, nm)
-                    st.session_state.last_mark_time = now
-                    st.session_state.last_mark_label = display
-                    st.session_state.last_marked = bool(marked)
-
             cv2.putText(
                 img,
                 display,
@@ -448,7 +619,7 @@ with tabs[2]:
         return av.VideoFrame.from_ndarray(img, format="bgr24")
 
     if run:
-        webrtc_streamer(
+        ctx = webrtc_streamer(
             key="attendance",
             mode=WebRtcMode.SENDRECV,
             rtc_configuration=RTC_CONFIG,
@@ -456,26 +627,40 @@ with tabs[2]:
             video_frame_callback=video_frame_callback,
             async_processing=True,
         )
+        # The worker also exits on its own after idle_timeout without frames
+        if not ctx.state.playing:
+            worker.stop()
 
-        label = st.session_state.get("last_mark_label")
-        marked = st.session_state.get("last_marked")
+        label = mark_status["label"]
+        marked = mark_status["marked"]
         if label and marked is not None:
             if marked:
                 status_placeholder.success(f"✅ Marked attendance: {label} ({date.today().isoformat()})")
             else:
                 status_placeholder.warning(f"Already marked today: {label}")
+
+        with st.expander("Stream latency"):
+            st.json(worker.stats())
+        if use_tracking:
+            with st.expander("Tracking stats"):
+                st.json(tracker.stats())
+        if controller:
+            with st.expander("Detection scale"):
+                st.json(controller.state())
     else:
+        worker.stop()
         st.info("Toggle **Start Camera** to begin browser webcam streaming.")
 
 # ---------- Reports ----------
-with tabs[3]:
+elif page == PAGES[3]:
+    import pandas as pd
     st.subheader("Attendance Reports")
     date_pick = st.date_input("Filter by date", value=date.today())
     date_str = date_pick.isoformat()
 
     today_rows = get_attendance(date_filter=date_str)
-    present_count = len(today_rows)
-    total_users = len(get_users())
+    present_count = count_present(date_str)
+    total_users = count_users()
 
     st.markdown(f"""
     <div style="display:flex; gap:14px; flex-wrap:wrap; margin: 8px 0 16px 0;">
@@ -511,10 +696,7 @@ with tabs[3]:
 
         st.divider()
         st.subheader("Export CSV")
-        reports_dir = Path("reports")
-        reports_dir.mkdir(exist_ok=True)
-        out_file = reports_dir / f"attendance_{date_str}.csv"
-        df.to_csv(out_file, index=False)
+        out_file, _ = ensure_report(date_str, date_str)
 
         with open(out_file, "rb") as f:
             st.download_button(
@@ -529,3 +711,37 @@ with tabs[3]:
         )
     else:
         st.write(f"No attendance records for {date_str}.")
+
+    st.divider()
+    st.subheader("Range summaries")
+    rcol1, rcol2 = st.columns(2)
+    with rcol1:
+        range_start = st.date_input("From", value=date_pick.replace(day=1), key="range_start")
+    with rcol2:
+        range_end = st.date_input("To", value=date_pick, key="range_end")
+    start_str, end_str = range_start.isoformat(), range_end.isoformat()
+
+    if range_start > range_end:
+        st.error("'From' must be on or before 'To'.")
+    else:
+        headcount = daily_headcount(start_str, end_str)
+        if headcount:
+            st.markdown("<span class='accent'>Daily headcount</span>", unsafe_allow_html=True)
+            st.dataframe(pd.DataFrame(headcount, columns=["date", "present"]), use_container_width=True)
+            st.markdown("<span class='accent'>Days present per user and month</span>", unsafe_allow_html=True)
+            st.dataframe(
+                pd.DataFrame(user_month_summary(start_str, end_str), columns=["user_id", "name", "month", "days_present"]),
+                use_container_width=True
+            )
+
+            range_file, _ = ensure_report(start_str, end_str)
+            with open(range_file, "rb") as f:
+                st.download_button(
+                    label=f"Download {range_file.name}",
+                    data=f,
+                    file_name=range_file.name,
+                    mime="text/csv",
+                    key="range_download"
+                )
+        else:
+            st.write(f"No attendance records between {start_str} and {end_str}.")
@@ -0,0 +1,130 @@
+"""
+Per-month archive files for closed attendance months.
+
+    python archive.py                    # archive every month older than the hot window (3 months)
+    python archive.py --keep-months 6
+    python archive.py --month 2025-01    # archive one month (again: merges rows that arrived late)
+    python archive.py --list
+
+Each archived month lives in data/archive/attendance_YYYY-MM.db, a small SQLite
+file with the same columns (and row ids) as the hot table. db.archive_month moves
+rows while the app keeps running; db.get_attendance and reports.py read the
+archives transparently for dates outside the hot window.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import sqlite3
+from datetime import date
+from pathlib import Path
+
+ARCHIVE_DIR = Path("data/archive")
+ARCHIVE_COLUMNS = "id, user_id, name, att_date, att_time"
+
+
+def archive_path(month: str) -> Path:
+    return ARCHIVE_DIR / f"attendance_{month}.db"
+
+
+def archived_months() -> list[str]:
+    """Months with an archive file, oldest first. A file only appears once it is complete."""
+    if not ARCHIVE_DIR.exists():
+        return []
+    return sorted(p.stem[len("attendance_"):] for p in ARCHIVE_DIR.glob("attendance_????-??.db"))
+
+
+def months_in_range(months, start: str | None, end: str | None) -> list[str]:
+    return [m for m in months if (not start or m >= start[:7]) and (not end or m <= end[:7])]
+
+
+def month_cutoff(keep_months: int, today: date | None = None) -> str:
+    """First month of the hot window: the current month and the keep_months - 1 before it."""
+    today = today or date.today()
+    y, m = divmod(today.year * 12 + today.month - 1 - (keep_months - 1), 12)
+    return f"{y:04d}-{m + 1:02d}"
+
+
+def _open_ro(month: str):
+    return sqlite3.connect(f"file:{archive_path(month)}?mode=ro", uri=True)
+
+
+def query_archive(month: str, select: str, start: str | None = None, end: str | None = None) -> list[tuple]:
+    """Runs SELECT <select> FROM attendance on one archive, optionally limited to a date range."""
+    conds, params = [], []
+    if start:
+        conds.append("att_date >= ?")
+        params.append(start)
+    if end:
+        conds.append("att_date <= ?")
+        params.append(end)
+    where = " WHERE " + " AND ".join(conds) if conds else ""
+    conn = _open_ro(month)
+    try:
+        return conn.execute(f"SELECT {select} FROM attendance{where}", params).fetchall()
+    finally:
+        conn.close()
+
+
+def read_archive(month: str, start: str | None = None, end: str | None = None) -> list[tuple]:
+    """[(id, user_id, name, att_date, att_time), ...] of one archive."""
+    return query_archive(month, ARCHIVE_COLUMNS, start, end)
+
+
+def write_archive(month: str, rows) -> Path:
+    """Writes rows (id, user_id, name, att_date, att_time) as the month's archive, replacing it atomically."""
+    ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+    path = archive_path(month)
+    tmp = path.with_name(path.name + ".tmp")
+    if tmp.exists():
+        tmp.unlink()
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("""
+            CREATE TABLE attendance (
+                id INTEGER PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                name TEXT NOT NULL,
+                att_date TEXT NOT NULL,
+                att_time TEXT NOT NULL,
+                UNIQUE(user_id, att_date)
+            )
+        """)
+        with conn:
+            conn.executemany(f"INSERT OR IGNORE INTO attendance ({ARCHIVE_COLUMNS}) VALUES (?, ?, ?, ?, ?)", rows)
+        conn.execute("CREATE INDEX idx_attendance_date_time ON attendance(att_date, att_time)")
+    finally:
+        conn.close()
+    with open(tmp, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return path
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--keep-months", type=int, default=3, help="months kept in the hot table, including the current one")
+    ap.add_argument("--month", help="archive this month (YYYY-MM) only")
+    ap.add_argument("--batch-rows", type=int, default=500, help="rows deleted from the hot table per transaction")
+    ap.add_argument("--list", action="store_true", help="list archive files and exit")
+    args = ap.parse_args()
+
+    from db import init_db, archive_month, archive_closed_months
+
+    if args.list:
+        for m in archived_months():
+            p = archive_path(m)
+            print(f"{m}  {p}  {p.stat().st_size / 1024:.0f} KiB")
+        return
+
+    init_db()
+    if args.month:
+        results = [archive_month(args.month, batch_rows=args.batch_rows)]
+    else:
+        results = archive_closed_months(args.keep_months, batch_rows=args.batch_rows)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
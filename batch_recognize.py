@@ -0,0 +1,224 @@
+"""
+Headless batch recognition over recorded video files and image folders.
+
+    python batch_recognize.py cctv/entrance_0900.mp4 photos/ --stride 5 --workers 8 --date 2026-10-17
+    python batch_recognize.py cctv/ --resume            # continue an interrupted job
+
+Frames are decoded lazily, every --stride-th frame is recognised on a process pool
+(each worker loads the gallery once) and the first sighting of each user is written
+through db.mark_attendance_batch (same one-mark-per-user-per-day rule as
+mark_attendance). Progress is checkpointed to a JSON state file so --resume skips
+sources and frames that were already processed.
+"""
+from __future__ import annotations
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import cv2
+
+from db import init_db, get_users, mark_attendance_batch
+from gallery import GalleryMatcher
+from vision import load_encodings, load_index, recognize_from_frame
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".bmp"}
+VIDEO_EXTS = {".mp4", ".avi", ".mov", ".mkv", ".m4v", ".webm"}
+
+_matcher = None
+_tolerance = 0.45
+
+
+def _init_worker(tolerance: float):
+    global _matcher, _tolerance
+    known = load_encodings()
+    if known is None:
+        raise RuntimeError("No gallery found; train first.")
+    index = load_index()
+    if index is not None and index.ntotal != len(known):
+        index = None
+    _matcher = GalleryMatcher.from_data(known, index=index)
+    _tolerance = tolerance
+
+
+def _recognize(frame):
+    return sorted({label for label, _ in recognize_from_frame(frame, _matcher, tolerance=_tolerance)} - {"Unknown"})
+
+
+def expand_sources(inputs):
+    """Files and directories (recursively) -> sorted list of image/video paths."""
+    out = []
+    for item in inputs:
+        p = Path(item)
+        if p.is_dir():
+            out.extend(f for f in sorted(p.rglob("*")) if f.suffix.lower() in IMAGE_EXTS | VIDEO_EXTS)
+        elif p.suffix.lower() in IMAGE_EXTS | VIDEO_EXTS:
+            out.append(p)
+        else:
+            print(f"skipping {p}: not an image or video", file=sys.stderr)
+    return out
+
+
+def iter_frames(path: Path, stride: int, start_frame: int = 0):
+    """Yields (frame_index, frame, seconds_from_start) for every stride-th frame at or after start_frame."""
+    if path.suffix.lower() in IMAGE_EXTS:
+        if start_frame == 0:
+            frame = cv2.imread(str(path))
+            if frame is not None:
+                yield 0, frame, 0.0
+        return
+
+    cap = cv2.VideoCapture(str(path))
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+        idx = 0
+        while True:
+            # grab() skips decoding for frames we do not need
+            if idx < start_frame or idx % stride:
+                if not cap.grab():
+                    break
+            else:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                yield idx, frame, idx / fps
+            idx += 1
+    finally:
+        cap.release()
+
+
+def job_state_path(sources, args) -> Path:
+    key = "|".join(str(p.resolve()) for p in sources) + f"|{args.stride}|{args.date}"
+    return Path("reports") / f"batch_{hashlib.sha1(key.encode()).hexdigest()[:12]}.json"
+
+
+def load_state(path: Path | None) -> dict:
+    """Job progress: finished sources, the source in progress and its next frame, first sightings."""
+    if path is not None and path.exists():
+        return json.loads(path.read_text())
+    return {"done": [], "current": None, "next_frame": 0, "sightings": {}}
+
+
+def save_state(path: Path, state: dict):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(state))
+    os.replace(tmp, path)
+
+
+def flush_sightings(state: dict, names: dict, att_date: str) -> int:
+    rows = [(uid, names.get(uid, "Unknown Name"), att_date, t) for uid, t in sorted(state["sightings"].items())]
+    return mark_attendance_batch(rows) if rows else 0
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("inputs", nargs="+", help="video files, image files or directories")
+    ap.add_argument("--stride", type=int, default=5, help="recognise every Nth video frame")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--tolerance", type=float, default=0.45)
+    ap.add_argument("--date", default=date.today().isoformat(), help="attendance date to record (YYYY-MM-DD)")
+    ap.add_argument("--start-time", help="wall-clock time of each video's first frame (HH:MM:SS); "
+                                         "otherwise the processing time is recorded")
+    ap.add_argument("--checkpoint-every", type=int, default=200, help="frames between checkpoints")
+    ap.add_argument("--state", help="job state file (default: derived from inputs under reports/)")
+    ap.add_argument("--resume", action="store_true", help="continue from the state file")
+    args = ap.parse_args()
+
+    sources = expand_sources(args.inputs)
+    if not sources:
+        raise SystemExit("No images or videos found.")
+
+    init_db()
+    names = {uid: nm for uid, nm, _ in get_users()}
+    state_path = Path(args.state) if args.state else job_state_path(sources, args)
+    state = load_state(state_path if args.resume else None)
+    done = set(state["done"])
+    start_clock = datetime.strptime(args.start_time, "%H:%M:%S") if args.start_time else None
+
+    pool = None
+    if args.workers > 1:
+        pool = ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(args.tolerance,))
+    else:
+        _init_worker(args.tolerance)
+
+    frames_total = 0
+    t0 = time.perf_counter()
+    since_checkpoint = 0
+    # One bounded in-flight window across all sources, so image folders (one frame
+    # per source) still keep every worker busy. Entries are (src, idx, offset_s,
+    # result or future); idx None marks the end of src. Results are consumed in
+    # submission order, so the last consumed entry is a valid resume point.
+    window = deque()
+    in_flight = 0
+
+    def record(labels, offset_s):
+        if start_clock:
+            t = (start_clock + timedelta(seconds=offset_s)).strftime("%H:%M:%S")
+        else:
+            t = datetime.now().strftime("%H:%M:%S")
+        for uid in labels:
+            # Keep the earliest sighting, like a live check-in would
+            if uid not in state["sightings"] or t < state["sightings"][uid]:
+                state["sightings"][uid] = t
+
+    def checkpoint():
+        state["done"] = sorted(done)
+        flush_sightings(state, names, args.date)
+        save_state(state_path, state)
+
+    def drain(limit):
+        nonlocal in_flight, frames_total, since_checkpoint
+        while in_flight > limit or (window and window[0][1] is None):
+            src, idx, offset_s, fut = window.popleft()
+            if idx is None:
+                done.add(str(src))
+                state["current"], state["next_frame"] = None, 0
+                continue
+            in_flight -= 1
+            record(fut.result() if pool else fut, offset_s)
+            state["current"], state["next_frame"] = str(src), idx + 1
+            frames_total += 1
+            since_checkpoint += 1
+            if since_checkpoint >= args.checkpoint_every:
+                since_checkpoint = 0
+                checkpoint()
+                rate = frames_total / (time.perf_counter() - t0)
+                print(f"{src.name}: frame {idx}, {rate:.1f} frames/s", file=sys.stderr)
+
+    try:
+        for src in sources:
+            if str(src) in done:
+                continue
+            start = state["next_frame"] if state["current"] == str(src) else 0
+            # Bounded window keeps decoded frames from piling up in memory
+            for idx, frame, offset_s in iter_frames(src, args.stride, start):
+                window.append((src, idx, offset_s, pool.submit(_recognize, frame) if pool else _recognize(frame)))
+                in_flight += 1
+                drain(2 * args.workers)
+            window.append((src, None, None, None))
+        drain(0)
+        checkpoint()
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+
+    elapsed = time.perf_counter() - t0
+    print(json.dumps({
+        "sources": len(sources),
+        "frames_processed": frames_total,
+        "frames_per_sec": frames_total / elapsed if elapsed else 0.0,
+        "users_seen": len(state["sightings"]),
+        "attendance_date": args.date,
+        "state_file": str(state_path),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Recall/latency of the IVF-PQ index against exact search, swept over nprobe.
+
+    python -m benchmarks.bench_ann --size 100000 --nprobe 1 4 8 16 32
+"""
+from __future__ import annotations
+import argparse
+import time
+import numpy as np
+
+from gallery import GalleryMatcher
+from ann_index import IVFPQIndex
+from benchmarks.common import synthetic_gallery, synthetic_queries, time_call
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--size", type=int, default=100_000)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--nlist", type=int, default=None)
+    ap.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    ap.add_argument("--rerank", type=int, default=32)
+    ap.add_argument("--tolerance", type=float, default=0.45)
+    args = ap.parse_args()
+
+    encodings, labels = synthetic_gallery(args.size)
+    queries, _ = synthetic_queries(encodings, labels, args.queries)
+
+    t0 = time.perf_counter()
+    index = IVFPQIndex.train(encodings, nlist=args.nlist)
+    build_s = time.perf_counter() - t0
+    print(f"gallery={args.size} nlist={index.nlist} build={build_s:.1f}s "
+          f"codes={index.codes.nbytes / 1e6:.1f}MB vs float32={args.size * 128 * 4 / 1e6:.1f}MB")
+
+    exact = GalleryMatcher(encodings, labels)
+    exact_ms = time_call(lambda: exact.match(queries, args.tolerance), 3) / args.queries
+    truth = exact.match(queries, args.tolerance)
+    truth_nn = np.argmin(exact.distances(queries), axis=1)
+
+    print(f"{'nprobe':>6} {'recall@1':>9} {'label agree':>12} {'ms/query':>9} {'exact ms/query':>15}")
+    for nprobe in args.nprobe:
+        matcher = GalleryMatcher(encodings, labels, index=index, rerank=args.rerank)
+        matcher.index.nprobe = nprobe
+        ms = time_call(lambda: matcher.match(queries, args.tolerance), 3) / args.queries
+        approx = matcher.match(queries, args.tolerance)
+        ids, _ = matcher.index.search(queries, matcher.matrix, k=1, rerank=args.rerank)
+        recall = float(np.mean(ids[:, 0] == truth_nn))
+        agree = float(np.mean([a.label == t.label for a, t in zip(approx, truth)]))
+        print(f"{nprobe:>6} {recall:>9.3f} {agree:>12.3f} {ms:>9.3f} {exact_ms:>15.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Full gallery vs per-user prototypes (compaction.compact_gallery) on a held-out split.
+
+Each user's encodings are split into a gallery part and a held-out part; the
+held-out images are matched against the full and the compacted gallery and the
+script reports gallery size, accuracy (right label), misses (Unknown), wrong
+labels and match latency. Uses the per-image encodings in data/encodings/manifest.pkl
+(train once first) or, with --synthetic N, a generated gallery.
+
+    python -m benchmarks.bench_compaction --prototypes 2 3 5
+    python -m benchmarks.bench_compaction --synthetic 30000 --holdout 0.2
+"""
+from __future__ import annotations
+import argparse
+import json
+
+import numpy as np
+
+from compaction import compact_gallery
+from gallery import GalleryMatcher
+from vision import load_manifest
+from benchmarks.common import synthetic_gallery, time_call
+
+
+def load_user_encodings(synthetic: int | None, seed: int):
+    if synthetic:
+        return synthetic_gallery(synthetic, seed=seed)
+    entries = [e for e in load_manifest().values() if e["encoding"] is not None]
+    if not entries:
+        raise SystemExit("No encodings in the manifest; train first or pass --synthetic N.")
+    return np.array([e["encoding"] for e in entries]), [e["user_id"] for e in entries]
+
+
+def split(labels, holdout: float, seed: int):
+    """Per-user split; users with a single image stay entirely in the gallery."""
+    rng = np.random.default_rng(seed)
+    rows = {}
+    for i, label in enumerate(labels):
+        rows.setdefault(label, []).append(i)
+    train, test = [], []
+    for idx in rows.values():
+        idx = rng.permutation(idx)
+        n_test = int(round(len(idx) * holdout)) if len(idx) > 1 else 0
+        n_test = min(max(n_test, 1 if len(idx) > 1 else 0), len(idx) - 1)
+        test.extend(idx[:n_test])
+        train.extend(idx[n_test:])
+    return np.array(train), np.array(test)
+
+
+def evaluate(matcher, queries, truth, tolerance: float, repeat: int):
+    results = matcher.match(queries, tolerance=tolerance)
+    labels = [m.label for m in results]
+    n = len(truth)
+    return {
+        "gallery_size": len(matcher),
+        "accuracy": sum(l == t for l, t in zip(labels, truth)) / n,
+        "unknown_rate": labels.count("Unknown") / n,
+        "wrong_rate": sum(l != t and l != "Unknown" for l, t in zip(labels, truth)) / n,
+        "match_ms": time_call(lambda: matcher.match(queries, tolerance=tolerance), repeat),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--prototypes", type=int, nargs="+", default=[3])
+    ap.add_argument("--outlier-dist", type=float, default=0.3)
+    ap.add_argument("--holdout", type=float, default=0.2, help="fraction of each user's images held out")
+    ap.add_argument("--tolerance", type=float, default=0.45)
+    ap.add_argument("--synthetic", type=int, help="use a synthetic gallery of this many encodings")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    encodings, labels = load_user_encodings(args.synthetic, args.seed)
+    train, test = split(labels, args.holdout, args.seed)
+    if not len(test):
+        raise SystemExit("Not enough images per user to hold any out.")
+    gallery_encs, gallery_labels = encodings[train], [labels[i] for i in train]
+    queries, truth = encodings[test], [labels[i] for i in test]
+
+    out = {"users": len(set(labels)), "held_out": len(test),
+           "full": evaluate(GalleryMatcher(gallery_encs, gallery_labels), queries, truth, args.tolerance, args.repeat)}
+    for k in args.prototypes:
+        encs, labs = compact_gallery(gallery_encs, gallery_labels, k=k, outlier_dist=args.outlier_dist)
+        out[f"prototypes_{k}"] = evaluate(GalleryMatcher(encs, labs), queries, truth, args.tolerance, args.repeat)
+    print(json.dumps(out, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Concurrency stress test for db.py: reader and writer threads hammer a scratch
+database for a fixed time; prints ops/sec per role and any "database is locked" errors.
+
+    python -m benchmarks.bench_db --readers 8 --writers 2 --seconds 10
+"""
+from __future__ import annotations
+import argparse
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+import db
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--readers", type=int, default=8)
+    ap.add_argument("--writers", type=int, default=2)
+    ap.add_argument("--seconds", type=float, default=10.0)
+    ap.add_argument("--seed-days", type=int, default=90, help="days of history to preload")
+    ap.add_argument("--users", type=int, default=500)
+    args = ap.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    db.DB_PATH = Path(tmp.name) / "stress.db"
+    db.init_db()
+
+    start = date.today() - timedelta(days=args.seed_days)
+    days = [(start + timedelta(days=d)).isoformat() for d in range(args.seed_days)]
+    db.mark_attendance_batch(
+        (f"u{u:05d}", f"User {u}", d, "09:00:00") for d in days for u in range(args.users)
+    )
+
+    stop = threading.Event()
+    counts = {"read": 0, "write": 0, "locked": 0}
+    lock = threading.Lock()
+
+    # Bypass the query cache so every read hits SQLite
+    get_attendance = db.get_attendance.__wrapped__
+
+    def reader(i):
+        n = 0
+        while not stop.is_set():
+            try:
+                get_attendance(days[(i + n) % len(days)])
+                n += 1
+            except sqlite3.OperationalError:
+                with lock:
+                    counts["locked"] += 1
+        db.close_conn()
+        with lock:
+            counts["read"] += n
+
+    def writer(i):
+        n = 0
+        while not stop.is_set():
+            try:
+                db.mark_attendance(f"w{i}-{n}", "Stress")
+                n += 1
+            except sqlite3.OperationalError:
+                with lock:
+                    counts["locked"] += 1
+        db.close_conn()
+        with lock:
+            counts["write"] += n
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(args.readers)]
+    threads += [threading.Thread(target=writer, args=(i,)) for i in range(args.writers)]
+    for t in threads:
+        t.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    db.close_conn()
+
+    print(f"readers={args.readers} writers={args.writers} history={args.seed_days}d x {args.users} users")
+    print(f"reads/s  {counts['read'] / args.seconds:10.1f}")
+    print(f"writes/s {counts['write'] / args.seconds:10.1f}")
+    print(f"locked errors {counts['locked']}")
+    tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
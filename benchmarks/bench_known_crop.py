@@ -0,0 +1,58 @@
+"""
+Training with HOG re-detection on every crop vs the known-crop fast path.
+
+Encodes the enrollment images twice with encode_images, once with use_crop_meta=False
+(detect on every image, as training used to) and once with the capture metadata
+written by capture_images, and reports the time saved and the extra images accepted.
+
+    python -m benchmarks.bench_known_crop --limit 300 --workers 4
+"""
+from __future__ import annotations
+import argparse
+import json
+import time
+from pathlib import Path
+
+from vision import IMAGES_DIR, crop_meta_path, encode_images
+
+
+def run(paths, workers: int, use_crop_meta: bool):
+    t0 = time.perf_counter()
+    results = encode_images(paths, [p.parent.name for p in paths], workers=workers, use_crop_meta=use_crop_meta)
+    elapsed = time.perf_counter() - t0
+    return {
+        "seconds": elapsed,
+        "images_per_sec": len(paths) / elapsed if elapsed else 0.0,
+        "accepted": sum(r is not None for r in results),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--images-dir", default=str(IMAGES_DIR))
+    ap.add_argument("--limit", type=int, default=300)
+    ap.add_argument("--workers", type=int, default=1)
+    args = ap.parse_args()
+
+    paths = sorted(Path(args.images_dir).glob("*/*.jpg"))[:args.limit]
+    if not paths:
+        raise SystemExit(f"No images under {args.images_dir}.")
+    with_meta = sum(crop_meta_path(p).exists() for p in paths)
+    if not with_meta:
+        print("No capture metadata found; both runs will detect. Re-capture with the current capture_images.")
+
+    detect = run(paths, args.workers, use_crop_meta=False)
+    fast = run(paths, args.workers, use_crop_meta=True)
+    print(json.dumps({
+        "images": len(paths),
+        "images_with_metadata": with_meta,
+        "detect_every_image": detect,
+        "known_crop": fast,
+        "time_saved_sec": detect["seconds"] - fast["seconds"],
+        "time_saved_pct": 100.0 * (1 - fast["seconds"] / detect["seconds"]) if detect["seconds"] else 0.0,
+        "extra_accepted": fast["accepted"] - detect["accepted"],
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
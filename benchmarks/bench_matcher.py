@@ -0,0 +1,55 @@
+"""
+Compares the old per-face compare_faces + face_distance path with GalleryMatcher.
+
+    python -m benchmarks.bench_matcher --faces 5
+"""
+from __future__ import annotations
+import argparse
+import numpy as np
+import face_recognition
+
+from gallery import GalleryMatcher
+from benchmarks.common import synthetic_gallery, synthetic_queries, time_call
+
+
+def legacy_match(known_data, encs, tolerance):
+    # Mirrors recognize_from_frame before GalleryMatcher
+    names = []
+    for enc in encs:
+        name = "Unknown"
+        matches = face_recognition.compare_faces(known_data["encodings"], enc, tolerance=tolerance)
+        if True in matches:
+            dists = face_recognition.face_distance(known_data["encodings"], enc)
+            best_idx = int(np.argmin(dists))
+            if matches[best_idx]:
+                name = known_data["labels"][best_idx]
+        names.append(name)
+    return names
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    ap.add_argument("--faces", type=int, default=5, help="faces per frame")
+    ap.add_argument("--tolerance", type=float, default=0.45)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    print(f"{'gallery':>8} {'legacy ms':>10} {'build ms':>9} {'matcher ms':>11} {'speedup':>8} {'agree':>6}")
+    for n in args.sizes:
+        encodings, labels = synthetic_gallery(n)
+        queries, _ = synthetic_queries(encodings, labels, args.faces)
+        known = {"encodings": list(encodings), "labels": labels}
+        encs = list(queries)
+
+        legacy_ms = time_call(lambda: legacy_match(known, encs, args.tolerance), args.repeat)
+        build_ms = time_call(lambda: GalleryMatcher.from_data(known), 1)
+        matcher = GalleryMatcher.from_data(known)
+        match_ms = time_call(lambda: matcher.match(encs, tolerance=args.tolerance), args.repeat)
+
+        agree = legacy_match(known, encs, args.tolerance) == [m.label for m in matcher.match(encs, args.tolerance)]
+        print(f"{n:>8} {legacy_ms:>10.2f} {build_ms:>9.2f} {match_ms:>11.2f} {legacy_ms / match_ms:>7.1f}x {str(agree):>6}")
+
+
+if __name__ == "__main__":
+    main()
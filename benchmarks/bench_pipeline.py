@@ -0,0 +1,228 @@
+"""
+Offline per-stage benchmark of the vision pipeline.
+
+Times each stage of vision.recognize_from_frame (resize, color conversion, HOG
+detection, encoding, matching; read from its metrics timers) plus drawing on
+frames with 0-10 faces, matching against synthetic galleries of several sizes,
+and training throughput in images/sec. Results are
+written as JSON; pass --baseline to compare against an earlier run and exit
+non-zero on regressions. capture_images needs a webcam, but its per-frame work is
+the same resize/convert/detect stages measured here.
+
+    python -m benchmarks.bench_pipeline --out bench.json
+    python -m benchmarks.bench_pipeline --baseline bench.json --threshold 0.15
+"""
+from __future__ import annotations
+import argparse
+import json
+import platform
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+import metrics
+from gallery import GalleryMatcher
+from vision import IMAGES_DIR, encode_images, face_models, recognize_from_frame
+from benchmarks.common import synthetic_gallery, synthetic_queries
+
+
+def load_face_crops(images_dir: Path, limit: int = 50):
+    crops = []
+    for p in sorted(images_dir.glob("*/*.jpg"))[:limit]:
+        img = cv2.imread(str(p))
+        if img is not None:
+            crops.append(img)
+    return crops
+
+
+def generate_frame(crops, n_faces: int, rng, size=(720, 1280)):
+    """Pastes n_faces enrollment crops onto a grey frame in a non-overlapping grid."""
+    h, w = size
+    frame = np.full((h, w, 3), 90, dtype=np.uint8)
+    if not crops or n_faces == 0:
+        return frame
+    cols = 5
+    cell_h, cell_w = h // 2, w // cols
+    for i in range(n_faces):
+        crop = crops[rng.integers(len(crops))]
+        scale = min(cell_h / crop.shape[0], cell_w / crop.shape[1]) * 0.8
+        crop = cv2.resize(crop, (0, 0), fx=scale, fy=scale)
+        r, c = divmod(i, cols)
+        y, x = r * cell_h + (cell_h - crop.shape[0]) // 2, c * cell_w + (cell_w - crop.shape[1]) // 2
+        frame[y:y + crop.shape[0], x:x + crop.shape[1]] = crop
+    return frame
+
+
+def read_video_frames(path, limit: int):
+    cap = cv2.VideoCapture(str(path))
+    frames = []
+    try:
+        while len(frames) < limit:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(frame)
+    finally:
+        cap.release()
+    return frames
+
+
+def time_stages(frames, matcher, repeat: int):
+    """
+    Median ms per stage across frames x repeat runs of vision.recognize_from_frame.
+    Stage times come from the pipeline's own metrics timers; drawing (done by the
+    app) and the end-to-end total are timed here.
+    """
+    face_models()  # load the dlib models outside the timed runs
+    was_enabled = metrics.enabled()
+    metrics.reset()
+    metrics.set_enabled(True)
+    samples = {"draw": [], "total": []}
+    try:
+        for _ in range(repeat):
+            for frame in frames:
+                t0 = time.perf_counter()
+                results = recognize_from_frame(frame, matcher)
+                t1 = time.perf_counter()
+                img = frame.copy()
+                for label, (top, right, bottom, left) in results:
+                    cv2.rectangle(img, (left, top), (right, bottom), (0, 255, 0), 2)
+                    cv2.putText(img, label, (left, max(20, top - 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+                t2 = time.perf_counter()
+                samples["draw"].append((t2 - t1) * 1000.0)
+                samples["total"].append((t2 - t0) * 1000.0)
+        hists = metrics.snapshot()["histograms"]
+    finally:
+        metrics.reset()
+        metrics.set_enabled(was_enabled)
+
+    out = {}
+    for stage in ("resize", "cvt_color", "detect", "encode", "match"):
+        # match is skipped on frames without faces
+        h = hists.get(f"vision.{stage}_ms")
+        out[f"{stage}_ms"] = float(h["p50"]) if h else 0.0
+    out.update({f"{k}_ms": float(np.median(v)) for k, v in samples.items()})
+    faces = hists.get("vision.faces_per_frame")
+    out["faces_detected"] = faces["sum"] / faces["count"] if faces else 0.0
+    return out
+
+
+def time_matching(sizes, face_counts, repeat: int):
+    out = {}
+    for n in sizes:
+        encodings, labels = synthetic_gallery(n)
+        matcher = GalleryMatcher(encodings, labels)
+        for k in face_counts:
+            if k == 0:
+                continue
+            queries, _ = synthetic_queries(encodings, labels, k)
+            runs = []
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                matcher.match(queries)
+                runs.append((time.perf_counter() - t0) * 1000.0)
+            out[f"gallery{n}.faces{k}.match_ms"] = float(np.median(runs))
+    return out
+
+
+def time_training(images_dir: Path, limit: int, workers: int):
+    paths = sorted(images_dir.glob("*/*.jpg"))[:limit]
+    if not paths:
+        return {}
+    t0 = time.perf_counter()
+    results = encode_images(paths, [p.parent.name for p in paths], workers=workers)
+    elapsed = time.perf_counter() - t0
+    return {
+        "train.images": len(paths),
+        "train.accepted": sum(r is not None for r in results),
+        "train.images_per_sec": len(paths) / elapsed,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float):
+    """Returns [(metric, baseline, current, change)] for metrics that got worse than threshold."""
+    regressions = []
+    for key, base in baseline.items():
+        cur = current.get(key)
+        if cur is None or not base:
+            continue
+        if key.endswith("_ms"):
+            change = (cur - base) / base
+        elif key.endswith("_per_sec"):
+            change = (base - cur) / base
+        else:
+            continue
+        if change > threshold:
+            regressions.append((key, base, cur, change))
+    return regressions
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--faces", type=int, nargs="+", default=[0, 1, 3, 5, 10])
+    ap.add_argument("--video", help="recorded clip to use instead of generated frames")
+    ap.add_argument("--frames", type=int, default=5, help="frames per face count (or from --video)")
+    ap.add_argument("--gallery-sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    ap.add_argument("--stage-gallery", type=int, default=10_000, help="gallery size used for the stage timings")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--images-dir", default=str(IMAGES_DIR))
+    ap.add_argument("--train-images", type=int, default=100)
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--out", default="bench_pipeline.json")
+    ap.add_argument("--baseline")
+    ap.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown before flagging, 0.2 = 20%%")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    images_dir = Path(args.images_dir)
+    encodings, labels = synthetic_gallery(args.stage_gallery)
+    matcher = GalleryMatcher(encodings, labels)
+
+    measured = {}
+    if args.video:
+        frames = read_video_frames(args.video, args.frames)
+        for k, v in time_stages(frames, matcher, args.repeat).items():
+            measured[f"video.{k}"] = v
+    else:
+        crops = load_face_crops(images_dir)
+        if not crops:
+            print(f"No face crops under {images_dir}; generated frames will contain no faces.", file=sys.stderr)
+        for n in args.faces:
+            frames = [generate_frame(crops, n, rng) for _ in range(args.frames)]
+            for k, v in time_stages(frames, matcher, args.repeat).items():
+                measured[f"faces{n}.{k}"] = v
+
+    measured.update(time_matching(args.gallery_sizes, args.faces, args.repeat))
+    measured.update(time_training(images_dir, args.train_images, args.workers))
+
+    result = {
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "args": vars(args),
+        },
+        "metrics": measured,
+    }
+    Path(args.out).write_text(json.dumps(result, indent=2))
+    for k in sorted(measured):
+        print(f"{k:40s} {measured[k]:12.3f}")
+    print(f"wrote {args.out}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())["metrics"]
+        regressions = compare(measured, baseline, args.threshold)
+        for key, base, cur, change in regressions:
+            print(f"REGRESSION {key}: {base:.3f} -> {cur:.3f} ({change:+.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
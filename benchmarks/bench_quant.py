@@ -0,0 +1,54 @@
+"""
+float32 vs float16 vs int8 gallery scans (GalleryMatcher quant=...), with agreement.
+
+Reports the bytes each brute-force scan reads (the resident working set of a
+memory-mapped gallery; the float32 rows are only touched for re-ranking), match
+latency, and how often the quantized path returns the same label as full
+precision, plus the largest distance/margin deviation among agreeing queries.
+
+    python -m benchmarks.bench_quant --sizes 10000 100000 --faces 5
+"""
+from __future__ import annotations
+import argparse
+
+import numpy as np
+
+from gallery import GalleryMatcher
+from benchmarks.common import synthetic_gallery, synthetic_queries, time_call
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    ap.add_argument("--faces", type=int, default=5, help="faces per frame")
+    ap.add_argument("--queries", type=int, default=500, help="queries for the agreement check")
+    ap.add_argument("--tolerance", type=float, default=0.45)
+    ap.add_argument("--rerank", type=int, default=32)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    print(f"{'gallery':>8} {'storage':>8} {'scan MB':>8} {'match ms':>9} {'agree':>7} {'max |dd|':>9} {'max |dm|':>9}")
+    for n in args.sizes:
+        encodings, labels = synthetic_gallery(n)
+        frame, _ = synthetic_queries(encodings, labels, args.faces)
+        # Half known faces, half strangers, so both sides of tolerance are checked
+        known_q, _ = synthetic_queries(encodings, labels, args.queries // 2, seed=2)
+        strangers = np.random.default_rng(3).normal(0.0, 0.05, size=(args.queries - len(known_q), encodings.shape[1]))
+        check = np.vstack([known_q, strangers])
+
+        exact = GalleryMatcher(encodings, labels, rerank=args.rerank)
+        reference = exact.match(check, tolerance=args.tolerance)
+        for quant in (None, "float16", "int8"):
+            matcher = exact if quant is None else GalleryMatcher(encodings, labels, rerank=args.rerank, quant=quant)
+            scanned = matcher.codes if quant else matcher.matrix
+            ms = time_call(lambda: matcher.match(frame, tolerance=args.tolerance), args.repeat)
+            got = matcher.match(check, tolerance=args.tolerance)
+            same = [(r, g) for r, g in zip(reference, got) if r.label == g.label]
+            dd = max((abs(r.distance - g.distance) for r, g in same), default=0.0)
+            dm = max((abs(r.margin - g.margin) for r, g in same if np.isfinite(r.margin)), default=0.0)
+            print(f"{n:>8} {quant or 'float32':>8} {scanned.nbytes / 2**20:>8.1f} {ms:>9.2f} "
+                  f"{len(same) / len(check):>7.2%} {dd:>9.2e} {dm:>9.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Cold import time and first-render time of the Streamlit app, per section.
+
+Every measurement runs in a fresh interpreter so nothing is cached in-process:
+import_s times only the app's top-level imports (parsed from the script), and
+first_render_s times a full first script run of one section through Streamlit's
+AppTest harness. The heavy modules left loaded after the run are listed too.
+Point --app at an older checkout to compare before/after:
+
+    git worktree add /tmp/before HEAD~1
+    python -m benchmarks.bench_startup --app /tmp/before/app.py --out before.json
+    python -m benchmarks.bench_startup --out after.json --baseline before.json
+"""
+from __future__ import annotations
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+
+HEAVY = ("cv2", "av", "streamlit_webrtc", "pandas", "face_recognition", "dlib")
+SECTIONS = ("👤 Register", "🧠 Train", "📸 Mark Attendance", "📊 Reports")
+
+_IMPORT_PROBE = """
+import ast, sys, time
+src = open(sys.argv[1], encoding="utf-8").read()
+block = ast.Module([n for n in ast.parse(src).body if isinstance(n, (ast.Import, ast.ImportFrom))], [])
+code = compile(block, sys.argv[1], "exec")
+t0 = time.perf_counter()
+exec(code, {})
+print(time.perf_counter() - t0)
+"""
+
+_RENDER_PROBE = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(sys.argv[1], default_timeout=300)
+if sys.argv[2]:
+    at.session_state["page"] = sys.argv[2]
+t0 = time.perf_counter()
+at.run()
+elapsed = time.perf_counter() - t0
+print(json.dumps({"seconds": elapsed, "exceptions": [e.value for e in at.exception],
+                  "modules": [m for m in sys.argv[3].split(",") if m in sys.modules]}))
+"""
+
+
+def probe(code: str, app: Path, *args) -> str:
+    out = subprocess.run([sys.executable, "-c", code, str(app), *args], cwd=app.parent,
+                         capture_output=True, text=True, check=True)
+    return out.stdout.strip().splitlines()[-1]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--app", default="app.py")
+    ap.add_argument("--runs", type=int, default=3, help="fresh processes per measurement (median reported)")
+    ap.add_argument("--out", default="bench_startup.json")
+    ap.add_argument("--baseline", help="earlier --out file to compare against")
+    args = ap.parse_args()
+    app = Path(args.app).resolve()
+
+    # Older versions have no section selector; AppTest then renders every tab
+    has_pages = "key=\"page\"" in app.read_text(encoding="utf-8")
+    metrics = {"import_s": float(np.median([float(probe(_IMPORT_PROBE, app)) for _ in range(args.runs)]))}
+    for section in SECTIONS if has_pages else ("all tabs",):
+        runs = [json.loads(probe(_RENDER_PROBE, app, section if has_pages else "", ",".join(HEAVY)))
+                for _ in range(args.runs)]
+        key = section.split(" ", 1)[1].lower().replace(" ", "_") if has_pages else "all_tabs"
+        metrics[f"{key}.first_render_s"] = float(np.median([r["seconds"] for r in runs]))
+        metrics[f"{key}.heavy_modules"] = runs[-1]["modules"]
+        if runs[-1]["exceptions"]:
+            metrics[f"{key}.exceptions"] = runs[-1]["exceptions"]
+
+    Path(args.out).write_text(json.dumps({"app": str(app), "metrics": metrics}, indent=2))
+    print(json.dumps(metrics, indent=2))
+    if args.baseline:
+        base = json.loads(Path(args.baseline).read_text())["metrics"]
+        for key, value in metrics.items():
+            if key.endswith("_s"):
+                ref = base.get(key, base.get("all_tabs.first_render_s") if key.endswith("first_render_s") else None)
+                if ref:
+                    print(f"{key:40s} {ref:8.3f}s -> {value:8.3f}s ({(value - ref) / ref:+.0%})")
+
+
+if __name__ == "__main__":
+    main()
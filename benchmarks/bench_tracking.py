@@ -0,0 +1,64 @@
+"""
+Per-frame CPU of full recognition on every frame vs FaceTracker on a recorded clip.
+
+    python -m benchmarks.bench_tracking clip.mp4 --detect-every 5 10 20
+"""
+from __future__ import annotations
+import argparse
+import time
+import cv2
+
+from gallery import GalleryMatcher
+from tracking import FaceTracker
+from vision import load_encodings, recognize_from_frame
+
+
+def read_frames(path, limit: int):
+    cap = cv2.VideoCapture(str(path))
+    frames = []
+    try:
+        while len(frames) < limit:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(frame)
+    finally:
+        cap.release()
+    return frames
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("video")
+    ap.add_argument("--frames", type=int, default=300)
+    ap.add_argument("--detect-every", type=int, nargs="+", default=[5, 10, 20])
+    ap.add_argument("--tolerance", type=float, default=0.45)
+    args = ap.parse_args()
+
+    known = load_encodings()
+    if known is None:
+        raise SystemExit("No gallery found; train first.")
+    matcher = GalleryMatcher.from_data(known)
+    frames = read_frames(args.video, args.frames)
+    if not frames:
+        raise SystemExit(f"Could not read frames from {args.video}")
+
+    t0 = time.process_time()
+    for f in frames:
+        recognize_from_frame(f, matcher, tolerance=args.tolerance)
+    base_ms = 1000 * (time.process_time() - t0) / len(frames)
+    print(f"every frame: {base_ms:.1f} ms CPU/frame ({len(frames)} frames)")
+
+    for n in args.detect_every:
+        tracker = FaceTracker(matcher, tolerance=args.tolerance, detect_every=n)
+        t0 = time.process_time()
+        for f in frames:
+            tracker.process(f)
+        ms = 1000 * (time.process_time() - t0) / len(frames)
+        s = tracker.stats()
+        print(f"detect_every={n:>3}: {ms:.1f} ms CPU/frame, saved {100 * (1 - ms / base_ms):.0f}% "
+              f"(detect frames {s['detect_frames']}, encodes {s['faces_encoded']}, skipped {s['encodes_skipped']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+from __future__ import annotations
+import time
+import numpy as np
+
+
+def synthetic_gallery(n: int, per_user: int = 30, dim: int = 128, seed: int = 0):
+    """
+    Returns (encodings, labels) shaped like a trained gallery: n float64 vectors,
+    per_user samples scattered around each identity centre (dlib-like scale).
+    """
+    rng = np.random.default_rng(seed)
+    n_users = max(1, -(-n // per_user))
+    centres = rng.normal(0.0, 0.05, size=(n_users, dim))
+    owner = np.arange(n) // per_user
+    encodings = centres[owner] + rng.normal(0.0, 0.012, size=(n, dim))
+    labels = [f"user{u:06d}" for u in owner]
+    return encodings, labels
+
+
+def synthetic_queries(encodings, labels, m: int, seed: int = 1):
+    """Returns (queries, true_labels): m fresh samples of identities already in the gallery."""
+    rng = np.random.default_rng(seed)
+    idx = rng.integers(0, len(labels), size=m)
+    queries = encodings[idx] + rng.normal(0.0, 0.012, size=(m, encodings.shape[1]))
+    return queries, [labels[i] for i in idx]
+
+
+def time_call(fn, repeat: int = 5):
+    """Returns the median wall time of fn() in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    return float(np.median(samples))
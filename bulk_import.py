@@ -0,0 +1,220 @@
+"""
+Bulk enrollment from a photo directory or zip archive.
+
+    python bulk_import.py hr_photos.zip --names users.csv --workers 8
+    python bulk_import.py hr_photos/ --names users.csv --max-side 640 --build-index
+
+The source is laid out as <user_id>/<photo>.jpg (any leading folders inside a zip
+are ignored); the CSV maps user_id to name (a "user_id,name" header is optional).
+Photos are streamed through a process pool that decodes them (EXIF orientation
+applied), shrinks them to --max-side, requires exactly one face and encodes it,
+and writes accepted photos as JPEG to data/images/<user_id>/<stem>.jpg; a photo
+whose name is already taken (on disk, or earlier in this import, e.g. a.png next
+to a.jpg) is rejected as duplicate_name rather than overwritten. The accepted
+encodings go straight into the training manifest, users are inserted in one transaction and
+the gallery is written once by train_encodings, which reuses those encodings.
+Rejected photos are listed in a CSV under reports/.
+"""
+from __future__ import annotations
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+import time
+import zipfile
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from db import init_db, add_users
+from vision import (IMAGES_DIR, MANIFEST_FILE, atomic_pickle, encode_rgb, ensure_dirs, face_models,
+                    load_manifest, train_encodings)
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+
+
+def read_names(path) -> dict:
+    names = {}
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for row in csv.reader(f):
+            if len(row) < 2 or not row[0].strip():
+                continue
+            if row[0].strip().lower() == "user_id":
+                continue
+            names[row[0].strip()] = row[1].strip()
+    return names
+
+
+def iter_entries(source: Path):
+    """Yields (user_id, stem, path_or_bytes, label) for every image under <user_id>/ in source."""
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as zf:
+            for info in zf.infolist():
+                parts = Path(info.filename).parts
+                if info.is_dir() or len(parts) < 2 or Path(parts[-1]).suffix.lower() not in IMAGE_EXTS:
+                    continue
+                # Read one member at a time; the caller bounds how many are in flight
+                yield parts[-2], Path(parts[-1]).stem, zf.read(info), info.filename
+    else:
+        for p in sorted(source.glob("*/*")):
+            if p.is_file() and p.suffix.lower() in IMAGE_EXTS:
+                yield p.parent.name, p.stem, p, str(p)
+
+
+def valid_user_id(uid: str) -> bool:
+    return bool(uid) and uid not in (".", "..") and "/" not in uid and "\\" not in uid
+
+
+def _import_one(data, user_id: str, stem: str, max_side: int, min_side: int, quality: int) -> dict:
+    """Normalises, checks and encodes one photo; writes it under IMAGES_DIR only if accepted."""
+    if isinstance(data, Path):
+        data = data.read_bytes()
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        return {"status": "rejected", "reason": "unreadable"}
+    h, w = img.shape[:2]
+    if min(h, w) < min_side:
+        return {"status": "rejected", "reason": "too_small"}
+    if max(h, w) > max_side:
+        f = max_side / max(h, w)
+        img = cv2.resize(img, (round(w * f), round(h * f)), interpolation=cv2.INTER_AREA)
+
+    enc, faces = encode_rgb(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+    if enc is None:
+        return {"status": "rejected", "reason": "no_face" if faces == 0 else "multiple_faces"}
+
+    ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        return {"status": "rejected", "reason": "encode_failed"}
+    raw = buf.tobytes()
+    out = IMAGES_DIR / user_id / f"{stem}.jpg"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_name(out.name + ".tmp")
+    tmp.write_bytes(raw)
+    os.replace(tmp, out)
+    st = out.stat()
+    return {
+        "status": "ok",
+        "key": out.relative_to(IMAGES_DIR).as_posix(),
+        # Same fields train_encodings records, so it reuses this encoding
+        "entry": {"encoding": enc, "sha1": hashlib.sha1(raw).hexdigest(), "size": st.st_size,
+                  "mtime": st.st_mtime_ns, "user_id": user_id},
+        "bytes_in": len(data),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("source", help="directory or .zip laid out as <user_id>/*.jpg")
+    ap.add_argument("--names", required=True, help="CSV of user_id,name")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--max-side", type=int, default=800, help="shrink photos so the longer side is at most this")
+    ap.add_argument("--min-side", type=int, default=80, help="reject photos whose shorter side is below this")
+    ap.add_argument("--quality", type=int, default=92, help="JPEG quality of the stored copies")
+    ap.add_argument("--allow-unnamed", action="store_true", help="import users missing from the CSV, named by their id")
+    ap.add_argument("--build-index", action="store_true", help="also train the ANN index")
+    args = ap.parse_args()
+
+    source = Path(args.source)
+    if not source.exists():
+        raise SystemExit(f"{source} not found")
+    names = read_names(args.names)
+    ensure_dirs()
+    init_db()
+
+    rejected = []
+    reasons = Counter()
+    accepted = {}
+    bytes_in = 0
+    seen = 0
+    claimed = set()
+    t0 = time.perf_counter()
+
+    pool = ProcessPoolExecutor(max_workers=args.workers, initializer=face_models) if args.workers > 1 else None
+    window = deque()
+
+    def drain(limit):
+        nonlocal bytes_in
+        while len(window) > limit:
+            label, user_id, fut = window.popleft()
+            res = fut.result() if pool else fut
+            if res["status"] == "ok":
+                accepted[res["key"]] = res["entry"]
+                bytes_in += res["bytes_in"]
+            else:
+                reasons[res["reason"]] += 1
+                rejected.append((label, user_id, res["reason"]))
+
+    try:
+        for user_id, stem, data, label in iter_entries(source):
+            seen += 1
+            if not valid_user_id(user_id):
+                reasons["bad_user_id"] += 1
+                rejected.append((label, user_id, "bad_user_id"))
+                continue
+            if user_id not in names and not args.allow_unnamed:
+                reasons["not_in_csv"] += 1
+                rejected.append((label, user_id, "not_in_csv"))
+                continue
+            key = f"{user_id}/{stem}.jpg"
+            if key in claimed or (IMAGES_DIR / key).exists():
+                reasons["duplicate_name"] += 1
+                rejected.append((label, user_id, "duplicate_name"))
+                continue
+            claimed.add(key)
+            job = (data, user_id, stem, args.max_side, args.min_side, args.quality)
+            window.append((label, user_id, pool.submit(_import_one, *job) if pool else _import_one(*job)))
+            drain(2 * args.workers)
+            if seen % 500 == 0:
+                rate = seen / (time.perf_counter() - t0)
+                print(f"{seen} photos, {len(accepted)} accepted, {rate:.1f} photos/s", file=sys.stderr)
+        drain(0)
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+    import_sec = time.perf_counter() - t0
+
+    users = sorted({e["user_id"] for e in accepted.values()})
+    add_users([(uid, names.get(uid, uid)) for uid in users])
+
+    manifest = load_manifest()
+    manifest.update(accepted)
+    atomic_pickle(manifest, MANIFEST_FILE)
+
+    t1 = time.perf_counter()
+    train_stats = train_encodings(build_index=args.build_index, incremental=True, workers=args.workers)
+    gallery_sec = time.perf_counter() - t1
+
+    reject_file = None
+    if rejected:
+        reject_file = Path("reports") / f"import_rejected_{datetime.now():%Y%m%d_%H%M%S}.csv"
+        reject_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(reject_file, "w", newline="") as f:
+            w = csv.writer(f)
+            w.writerow(["source", "user_id", "reason"])
+            w.writerows(rejected)
+
+    print(json.dumps({
+        "photos_seen": seen,
+        "photos_accepted": len(accepted),
+        "photos_rejected": dict(reasons),
+        "users_imported": len(users),
+        "users_in_csv_without_photos": len(set(names) - set(users)),
+        "import_sec": import_sec,
+        "photos_per_sec": seen / import_sec if import_sec else 0.0,
+        "input_mb_per_sec": bytes_in / 2**20 / import_sec if import_sec else 0.0,
+        "gallery_sec": gallery_sec,
+        "gallery_size": train_stats["gallery_size"],
+        "images_encoded_by_training": train_stats["images_added"],
+        "rejected_file": str(reject_file) if reject_file else None,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
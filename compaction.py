@@ -0,0 +1,74 @@
+from __future__ import annotations
+import numpy as np
+
+
+def _pairwise(x):
+    sq = np.einsum("ij,ij->i", x, x)
+    d2 = sq[:, None] + sq[None, :] - 2.0 * (x @ x.T)
+    np.maximum(d2, 0.0, out=d2)
+    return np.sqrt(d2)
+
+
+def select_prototypes(encodings, k: int = 3, outlier_dist: float = 0.3, iters: int = 10) -> np.ndarray:
+    """
+    Returns the row indices of one user's representative encodings.
+
+    k medoids are chosen greedily (each addition removes the most total distance)
+    and refined by reassigning samples and re-centring each cluster on its medoid.
+    If some sample is still farther than outlier_dist from every medoid (a second
+    look such as glasses), the farthest one is kept as an extra prototype.
+    Medoids are real samples, so match distances keep their usual meaning.
+    """
+    x = np.asarray(encodings, dtype=np.float64)
+    n = len(x)
+    if n <= k:
+        return np.arange(n)
+    d = _pairwise(x)
+
+    medoids = [int(np.argmin(d.sum(axis=1)))]
+    nearest = d[medoids[0]].copy()
+    while len(medoids) < k:
+        gain = np.maximum(nearest[None, :] - d, 0.0).sum(axis=1)
+        gain[medoids] = -1.0
+        c = int(np.argmax(gain))
+        medoids.append(c)
+        nearest = np.minimum(nearest, d[c])
+
+    for _ in range(iters):
+        assign = np.argmin(d[medoids], axis=0)
+        updated = []
+        for j, m in enumerate(medoids):
+            members = np.flatnonzero(assign == j)
+            if len(members) == 0:
+                updated.append(m)
+                continue
+            updated.append(int(members[np.argmin(d[np.ix_(members, members)].sum(axis=1))]))
+        if updated == medoids:
+            break
+        medoids = updated
+
+    far = d[medoids].min(axis=0)
+    j = int(np.argmax(far))
+    if far[j] > outlier_dist:
+        medoids.append(j)
+    return np.array(sorted(set(medoids)), dtype=np.intp)
+
+
+def compact_gallery(encodings, labels, k: int = 3, outlier_dist: float = 0.3):
+    """
+    Reduces every label to select_prototypes() of its encodings.
+    Returns (encodings, labels) with labels in first-seen order.
+    """
+    encodings = np.asarray(encodings, dtype=np.float64).reshape(len(labels), -1)
+    rows = {}
+    for i, label in enumerate(labels):
+        rows.setdefault(label, []).append(i)
+
+    out_encs, out_labels = [], []
+    for label, idx in rows.items():
+        idx = np.asarray(idx)
+        keep = idx[select_prototypes(encodings[idx], k=k, outlier_dist=outlier_dist)]
+        out_encs.append(encodings[keep])
+        out_labels.extend([label] * len(keep))
+    dim = encodings.shape[1] if encodings.ndim == 2 else 128
+    return (np.concatenate(out_encs) if out_encs else np.empty((0, dim))), out_labels
@@ -1,83 +1,424 @@
+import functools
 import sqlite3
+import threading
+import time
 from pathlib import Path
 from datetime import datetime, date
 
+import metrics
+from archive import archived_months, month_cutoff, months_in_range, read_archive, write_archive
+
 DB_PATH = Path("database.db")
 
+# Applied to every new connection. WAL lets readers run alongside the writer;
+# busy_timeout makes a blocked writer wait instead of failing with "database is locked".
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA temp_store=MEMORY",
+)
+
+_local = threading.local()
+
+ATT_COLUMNS = "user_id, name, att_date, att_time"
+# Pause between the short delete transactions of archive_month, so check-ins
+# waiting on the write lock get it between batches
+ARCHIVE_BATCH_PAUSE = 0.01
+
+# Read-query cache shared by every thread/session. Entries are dropped whenever
+# the data version changes: on every write made through this module, and when
+# PRAGMA data_version on a process-wide monitor connection shows a commit from
+# any other connection (checked on every cached read, e.g. for batch_recognize.py
+# or stream_server.py writing from another process).
+CACHE_MAX_ENTRIES = 256
+_cache_lock = threading.Lock()
+_cache = {}
+_data_version = 0
+_monitors = {}
+cache_counters = {"hits": 0, "misses": 0, "invalidations": 0}
+
+def _connect(path):
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
 def get_conn():
-    return sqlite3.connect(DB_PATH, check_same_thread=False)
+    """
+    Returns this thread's connection to DB_PATH, opening it on first use.
+    Connections are reused across calls; do not close them (see close_conn).
+    """
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    key = str(DB_PATH)
+    conn = conns.get(key)
+    if conn is None:
+        conn = conns[key] = _connect(DB_PATH)
+    return conn
+
+def close_conn():
+    """Closes this thread's connections (e.g. before a worker thread exits)."""
+    for conn in getattr(_local, "conns", {}).values():
+        conn.close()
+    _local.conns = {}
+
+def bump_data_version():
+    """Invalidates every cached query result; called after each committed write."""
+    global _data_version
+    with _cache_lock:
+        _data_version += 1
+        _cache.clear()
+        cache_counters["invalidations"] += 1
+
+def _check_external_writes():
+    """
+    Bumps the data version if another connection committed since the last check.
+    One monitor connection per database file, shared by all threads, so the
+    baseline survives Streamlit's per-rerun script threads.
+    """
+    global _data_version
+    key = str(DB_PATH)
+    with _cache_lock:
+        monitor = _monitors.get(key)
+        if monitor is None:
+            conn = _connect(DB_PATH)
+            monitor = _monitors[key] = [conn, conn.execute("PRAGMA data_version").fetchone()[0]]
+            return
+        dv = monitor[0].execute("PRAGMA data_version").fetchone()[0]
+        if dv != monitor[1]:
+            monitor[1] = dv
+            _data_version += 1
+            _cache.clear()
+            cache_counters["invalidations"] += 1
+
+def cached_query(fn):
+    """
+    Caches fn(*args, **kwargs) (a read returning rows or a scalar) until the next
+    data version. Lists are returned as copies, so callers may modify them.
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        _check_external_writes()
+        key = (fn.__qualname__, str(DB_PATH), args, tuple(sorted(kwargs.items())))
+        with _cache_lock:
+            version = _data_version
+            hit = key in _cache
+            cache_counters["hits" if hit else "misses"] += 1
+            if hit:
+                result = _cache[key]
+        metrics.inc("db.cache_hits" if hit else "db.cache_misses")
+        if hit:
+            return list(result) if isinstance(result, list) else result
+        result = fn(*args, **kwargs)
+        with _cache_lock:
+            # A write that landed while we were reading makes this result stale
+            if version == _data_version:
+                if len(_cache) >= CACHE_MAX_ENTRIES:
+                    _cache.clear()
+                _cache[key] = result
+        return list(result) if isinstance(result, list) else result
+    return wrapper
+
+def cache_stats() -> dict:
+    with _cache_lock:
+        return dict(cache_counters, entries=len(_cache), data_version=_data_version)
+
+# Rollups of the attendance table, kept current by triggers in the same
+# transaction as every insert (attendance rows are insert-only), so dashboard
+# queries read one row per day or per user-month instead of scanning history.
+ROLLUP_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS daily_headcount (
+        att_date TEXT PRIMARY KEY,
+        present INTEGER NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS user_month_counts (
+        user_id TEXT NOT NULL,
+        month TEXT NOT NULL,
+        name TEXT NOT NULL,
+        days_present INTEGER NOT NULL,
+        PRIMARY KEY (user_id, month)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_user_month_counts_month ON user_month_counts(month)",
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_attendance_rollups AFTER INSERT ON attendance
+    BEGIN
+        INSERT INTO daily_headcount (att_date, present) VALUES (NEW.att_date, 1)
+            ON CONFLICT(att_date) DO UPDATE SET present = present + 1;
+        INSERT INTO user_month_counts (user_id, month, name, days_present)
+            VALUES (NEW.user_id, substr(NEW.att_date, 1, 7), NEW.name, 1)
+            ON CONFLICT(user_id, month) DO UPDATE SET days_present = days_present + 1, name = MAX(name, NEW.name);
+    END
+    """,
+)
 
 def init_db():
     conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            user_id TEXT PRIMARY KEY,
-            name TEXT NOT NULL,
-            created_at TEXT NOT NULL
-        )
-    """)
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS attendance (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id TEXT NOT NULL,
-            name TEXT NOT NULL,
-            att_date TEXT NOT NULL,
-            att_time TEXT NOT NULL,
-            UNIQUE(user_id, att_date)
+    with conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS users (
+                user_id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                created_at TEXT NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS attendance (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                name TEXT NOT NULL,
+                att_date TEXT NOT NULL,
+                att_time TEXT NOT NULL,
+                UNIQUE(user_id, att_date)
+            )
+        """)
+        # Serves get_attendance: equality on att_date + att_time ordering, and the
+        # unfiltered att_date DESC, att_time DESC listing
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_date_time ON attendance(att_date, att_time)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_users_created_at ON users(created_at)")
+
+        has_rollups = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='trigger' AND name='trg_attendance_rollups'"
+        ).fetchone()
+        for stmt in ROLLUP_SCHEMA:
+            conn.execute(stmt)
+    if not has_rollups:
+        # First start with rollups: backfill them from the existing history
+        rebuild_rollups()
+
+def _raw_rollups(conn):
+    """
+    Aggregates of the full history (attendance table + archives) in rollup form:
+    ({att_date: present}, {(user_id, month): (name, days_present)}).
+    """
+    archived = archived_months()
+    skip = f"WHERE substr(att_date, 1, 7) NOT IN ({','.join('?' * len(archived))})" if archived else ""
+    daily = dict(conn.execute(f"SELECT att_date, COUNT(*) FROM attendance {skip} GROUP BY att_date", archived))
+    monthly = {
+        (u, m): (name, n) for u, m, name, n in conn.execute(f"""
+            SELECT user_id, substr(att_date, 1, 7) AS month, MAX(name), COUNT(*) FROM attendance {skip}
+            GROUP BY user_id, month
+        """, archived)
+    }
+    for month in archived:
+        for _, uid, name, att_date, _ in _archived_month_rows(conn, month):
+            daily[att_date] = daily.get(att_date, 0) + 1
+            prev_name, n = monthly.get((uid, month), (name, 0))
+            monthly[(uid, month)] = (max(prev_name, name), n + 1)
+    return daily, monthly
+
+def rebuild_rollups():
+    """Recomputes both rollup tables from the attendance table and its archives in one transaction."""
+    conn = get_conn()
+    daily, monthly = _raw_rollups(conn)
+    with conn:
+        conn.execute("DELETE FROM daily_headcount")
+        conn.execute("DELETE FROM user_month_counts")
+        conn.executemany("INSERT INTO daily_headcount VALUES (?, ?)", daily.items())
+        conn.executemany(
+            "INSERT INTO user_month_counts VALUES (?, ?, ?, ?)",
+            [(u, m, name, n) for (u, m), (name, n) in monthly.items()]
         )
-    """)
-    conn.commit()
-    conn.close()
+    bump_data_version()
+
+def check_rollups() -> list[tuple]:
+    """
+    Compares the rollups with aggregates of the attendance table and its archives.
+    Returns [(table, key, rollup_value, raw_value), ...]; empty when consistent.
+    """
+    conn = get_conn()
+    daily, monthly = _raw_rollups(conn)
+    rollup_daily = dict(conn.execute("SELECT att_date, present FROM daily_headcount"))
+    rollup_monthly = {
+        (u, m): n for u, m, n in conn.execute("SELECT user_id, month, days_present FROM user_month_counts")
+    }
+    raw_monthly = {k: n for k, (_, n) in monthly.items()}
+    mismatches = []
+    for table, rollup, raw in (("daily_headcount", rollup_daily, daily),
+                               ("user_month_counts", rollup_monthly, raw_monthly)):
+        for key in sorted(rollup.keys() | raw.keys()):
+            if rollup.get(key) != raw.get(key):
+                mismatches.append((table, key, rollup.get(key), raw.get(key)))
+    return mismatches
 
 def add_user(user_id: str, name: str):
     conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT OR REPLACE INTO users (user_id, name, created_at) VALUES (?, ?, ?)",
-        (user_id.strip(), name.strip(), datetime.now().isoformat(timespec="seconds"))
-    )
-    conn.commit()
-    conn.close()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO users (user_id, name, created_at) VALUES (?, ?, ?)",
+            (user_id.strip(), name.strip(), datetime.now().isoformat(timespec="seconds"))
+        )
+    bump_data_version()
+
+def add_users(rows) -> int:
+    """rows: iterable of (user_id, name). Inserts/replaces all of them in one transaction."""
+    now = datetime.now().isoformat(timespec="seconds")
+    params = [(uid.strip(), nm.strip(), now) for uid, nm in rows]
+    conn = get_conn()
+    with conn:
+        conn.executemany("INSERT OR REPLACE INTO users (user_id, name, created_at) VALUES (?, ?, ?)", params)
+    bump_data_version()
+    return len(params)
 
+@cached_query
 def get_users():
     conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT user_id, name, created_at FROM users ORDER BY created_at DESC")
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+    return conn.execute("SELECT user_id, name, created_at FROM users ORDER BY created_at DESC").fetchall()
 
 def mark_attendance(user_id: str, name: str) -> bool:
     """Returns True if marked now, False if already marked today."""
     conn = get_conn()
-    cur = conn.cursor()
     today = date.today().isoformat()
     now_time = datetime.now().strftime("%H:%M:%S")
     try:
-        cur.execute(
-            "INSERT INTO attendance (user_id, name, att_date, att_time) VALUES (?, ?, ?, ?)",
-            (user_id, name, today, now_time)
-        )
-        conn.commit()
+        with metrics.timer("db.write_ms"), conn:
+            conn.execute(
+                "INSERT INTO attendance (user_id, name, att_date, att_time) VALUES (?, ?, ?, ?)",
+                (user_id, name, today, now_time)
+            )
+        metrics.inc("db.rows_written")
+        bump_data_version()
         return True
     except sqlite3.IntegrityError:
         return False
-    finally:
-        conn.close()
 
+def _archived_month_rows(conn, month: str, start: str | None = None, end: str | None = None) -> list[tuple]:
+    """
+    [(id, user_id, name, att_date, att_time), ...] newest first for an archived
+    month, clipped to [start, end]: the archive plus hot rows for that month it
+    does not hold yet (late inserts, or rows of an archive_month still deleting).
+    """
+    lo = max(start, month + "-01") if start else month + "-01"
+    hi = min(end, month + "-31") if end else month + "-31"
+    rows = read_archive(month, lo, hi)
+    seen = {r[0] for r in rows}
+    rows += [
+        r for r in conn.execute(f"SELECT id, {ATT_COLUMNS} FROM attendance WHERE att_date BETWEEN ? AND ?", (lo, hi))
+        if r[0] not in seen
+    ]
+    rows.sort(key=lambda r: (r[3], r[4], r[0]), reverse=True)
+    return rows
+
+def iter_attendance(start: str | None = None, end: str | None = None, chunk_rows: int = 5000):
+    """
+    Yields lists of (user_id, name, att_date, att_time) for an inclusive date range,
+    newest first, across the attendance table and the archived months it covers.
+    Spans of the hot table are streamed chunk_rows at a time; an archived month is
+    read whole (one month of rows) to merge it with its late hot rows.
+    """
+    conn = get_conn()
+    conds, params = (["att_date <= ?"], [end]) if end else ([], [])
+    order = "ORDER BY att_date DESC, att_time DESC"
+    for month in reversed(months_in_range(archived_months(), start, end)):
+        where = " WHERE " + " AND ".join(conds + ["att_date > ?"])
+        cur = conn.execute(f"SELECT {ATT_COLUMNS} FROM attendance{where} {order}", params + [month + "-31"])
+        yield from iter(lambda: cur.fetchmany(chunk_rows), [])
+        rows = [r[1:] for r in _archived_month_rows(conn, month, start, end)]
+        for i in range(0, len(rows), chunk_rows):
+            yield rows[i:i + chunk_rows]
+        conds, params = ["att_date < ?"], [month + "-01"]
+    if start:
+        conds.append("att_date >= ?")
+        params.append(start)
+    where = " WHERE " + " AND ".join(conds) if conds else ""
+    cur = conn.execute(f"SELECT {ATT_COLUMNS} FROM attendance{where} {order}", params)
+    yield from iter(lambda: cur.fetchmany(chunk_rows), [])
+
+@cached_query
 def get_attendance(date_filter: str | None = None):
+    """Rows newest first, reading archive files for archived months."""
+    return [r for chunk in iter_attendance(date_filter, date_filter) for r in chunk]
+
+def mark_attendance_batch(rows) -> int:
+    """
+    rows: iterable of (user_id, name, att_date, att_time).
+    Inserts in one transaction, skipping (user_id, att_date) pairs already present.
+    Returns number of rows inserted.
+    """
+    rows = _drop_archived(list(rows))
     conn = get_conn()
-    cur = conn.cursor()
-    if date_filter:
-        cur.execute(
-            "SELECT user_id, name, att_date, att_time FROM attendance WHERE att_date=? ORDER BY att_time DESC",
-            (date_filter,)
-        )
-    else:
-        cur.execute(
-            "SELECT user_id, name, att_date, att_time FROM attendance ORDER BY att_date DESC, att_time DESC"
-        )
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+    with metrics.timer("db.write_ms"), conn:
+        # rowcount, not total_changes: the latter also counts the rollup trigger's upserts
+        written = conn.executemany(
+            "INSERT OR IGNORE INTO attendance (user_id, name, att_date, att_time) VALUES (?, ?, ?, ?)",
+            rows
+        ).rowcount
+    metrics.inc("db.rows_written", written)
+    if written:
+        bump_data_version()
+    return written
+
+def _drop_archived(rows: list) -> list:
+    """Drops (user_id, name, att_date, att_time) rows already present in an archive file."""
+    archived = set(archived_months())
+    months = {r[2][:7] for r in rows} & archived
+    if not months:
+        return rows
+    done = {(r[1], r[3]) for m in months for r in read_archive(m)}
+    return [r for r in rows if (r[0], r[2]) not in done]
+
+def get_marked_user_ids(att_date: str) -> set[str]:
+    conn = get_conn()
+    rows = conn.execute("SELECT user_id FROM attendance WHERE att_date=?", (att_date,)).fetchall()
+    marked = {r[0] for r in rows}
+    if att_date[:7] in archived_months():
+        marked |= {r[1] for r in read_archive(att_date[:7], att_date, att_date)}
+    return marked
+
+def archive_month(month: str, batch_rows: int = 500) -> dict:
+    """
+    Moves a closed month ('YYYY-MM') from the attendance table to its archive file
+    without blocking check-ins: rows are copied from a WAL read snapshot, the file
+    is written and swapped in atomically, then the copied rows are deleted in short
+    transactions of batch_rows. Readers merge archive and hot rows by id, so every
+    row stays visible exactly once throughout. Running it again for an archived
+    month folds in rows that arrived late. Rollups are untouched: they already
+    count these rows and nothing recounts them.
+    """
+    if month >= date.today().strftime("%Y-%m"):
+        raise ValueError(f"{month} is not a closed month")
+    t0 = time.perf_counter()
+    conn = get_conn()
+    hot = conn.execute(
+        f"SELECT id, {ATT_COLUMNS} FROM attendance WHERE att_date BETWEEN ? AND ?",
+        (month + "-01", month + "-31")
+    ).fetchall()
+    existing = read_archive(month) if month in archived_months() else []
+    path, archive_rows = None, len(existing)
+    if hot:
+        path = write_archive(month, existing + hot)
+        archived = {(r[1], r[3]) for r in read_archive(month)}
+        archive_rows = len(archived)
+        missing = [r for r in hot if (r[1], r[3]) not in archived]
+        if missing:
+            raise RuntimeError(f"archive of {month} is missing {len(missing)} rows; hot rows kept")
+        ids = [r[0] for r in hot]
+        for i in range(0, len(ids), batch_rows):
+            batch = ids[i:i + batch_rows]
+            with conn:
+                conn.execute(f"DELETE FROM attendance WHERE id IN ({','.join('?' * len(batch))})", batch)
+            time.sleep(ARCHIVE_BATCH_PAUSE)
+        bump_data_version()
+    return {
+        "month": month,
+        "rows_moved": len(hot),
+        "archive_rows": archive_rows,
+        "file": str(path) if path else None,
+        "seconds": time.perf_counter() - t0,
+    }
+
+def archive_closed_months(keep_months: int = 3, batch_rows: int = 500) -> list[dict]:
+    """Archives every month older than the hot window of keep_months (current month included)."""
+    if keep_months < 1:
+        raise ValueError("keep_months must be at least 1")
+    cutoff = month_cutoff(keep_months)
+    months = [r[0] for r in get_conn().execute(
+        "SELECT DISTINCT substr(att_date, 1, 7) FROM attendance WHERE att_date < ? ORDER BY 1", (cutoff + "-01",)
+    )]
+    return [archive_month(m, batch_rows) for m in months]
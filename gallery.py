@@ -0,0 +1,385 @@
+from __future__ import annotations
+import copy
+import json
+import os
+import struct
+import zlib
+from pathlib import Path
+from typing import NamedTuple
+import numpy as np
+
+GALLERY_MAGIC = b"FAGALLRY"
+GALLERY_VERSION = 1
+QUANT_KINDS = ("float16", "int8")
+_ALIGN = 64
+# Rows dequantized per step when scanning a quantized gallery
+_QUANT_CHUNK = 16384
+
+
+class Match(NamedTuple):
+    label: str
+    distance: float
+    margin: float
+
+
+def _align(n: int) -> int:
+    return -(-n // _ALIGN) * _ALIGN
+
+
+def _group_by_label(encodings, labels):
+    """Returns (matrix, label_ids, label_names, order) with rows sorted by label."""
+    labels = [str(l) for l in labels]
+    if len(encodings) != len(labels):
+        raise ValueError("encodings and labels must have the same length")
+    names = sorted(set(labels))
+    lookup = {n: i for i, n in enumerate(names)}
+    ids = np.fromiter((lookup[l] for l in labels), dtype=np.int32, count=len(labels))
+    order = np.argsort(ids, kind="stable")
+    if labels:
+        matrix = np.asarray(encodings, dtype=np.float32).reshape(len(labels), -1)[order]
+    else:
+        matrix = np.empty((0, 128), dtype=np.float32)
+    return np.ascontiguousarray(matrix), ids[order], names, order
+
+
+def _raw(a):
+    return np.ascontiguousarray(a).reshape(-1).view(np.uint8)
+
+
+def _checksum(*arrays) -> int:
+    crc = 0
+    for a in arrays:
+        if a is not None:
+            crc = zlib.crc32(_raw(a), crc)
+    return crc
+
+
+def quantize(matrix, kind: str):
+    """
+    Returns (codes, scale) for a float32 matrix. float16 codes need no scale;
+    int8 codes are symmetric per dimension: x ~= codes * scale.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if kind == "float16":
+        return matrix.astype(np.float16), None
+    if kind == "int8":
+        scale = np.abs(matrix).max(axis=0) / 127.0 if len(matrix) else np.ones(matrix.shape[1], np.float32)
+        scale = np.where(scale > 0, scale, 1.0).astype(np.float32)
+        codes = np.clip(np.rint(matrix / scale), -127, 127).astype(np.int8)
+        return codes, scale
+    raise ValueError(f"Unknown quantization {kind!r}; expected one of {QUANT_KINDS}")
+
+
+class Gallery:
+    """
+    Read-only gallery as stored on disk by save_gallery().
+
+    matrix (float32, count x dim), sq_norms and label_ids are memory-mapped, so
+    opening a gallery only parses the header; label_names is the small label table.
+    A quantized gallery also carries codes (float16 or int8) and, for int8, the
+    per-dimension scale; quant names the kind (None when not quantized).
+    """
+
+    def __init__(self, matrix, sq_norms, label_ids, label_names, checksum: int | None = None,
+                 quant: str | None = None, codes=None, scale=None):
+        self.matrix = matrix
+        self.sq_norms = sq_norms
+        self.label_ids = label_ids
+        self.label_names = list(label_names)
+        self.checksum = checksum
+        self.quant = quant
+        self.codes = codes
+        self.scale = scale
+        self._labels = None
+
+    def __len__(self):
+        return len(self.label_ids)
+
+    @property
+    def dim(self) -> int:
+        return self.matrix.shape[1]
+
+    @property
+    def labels(self) -> list[str]:
+        if self._labels is None:
+            self._labels = [self.label_names[i] for i in self.label_ids]
+        return self._labels
+
+    def __getitem__(self, key):
+        # Dict-style access kept for callers written against the old pickle format
+        if key == "encodings":
+            return self.matrix
+        if key == "labels":
+            return self.labels
+        raise KeyError(key)
+
+    def verify(self) -> bool:
+        """Recomputes the data checksum (reads the whole file)."""
+        return _checksum(self.matrix, self.sq_norms, self.label_ids, self.codes, self.scale) == self.checksum
+
+
+def save_gallery(path, encodings, labels, quant: str | None = None) -> Gallery:
+    """
+    Writes encodings/labels atomically in the versioned gallery format and returns
+    the reopened Gallery. Layout: magic, uint32 header length, JSON header (version,
+    dim, count, label table, crc32), then 64-byte aligned float32 matrix, float32
+    squared norms and int32 label ids. With quant ("float16" or "int8") the
+    quantized codes (and int8 scale) follow; the float32 matrix stays for re-ranking.
+    """
+    path = Path(path)
+    matrix, ids, names, _ = _group_by_label(encodings, labels)
+    sq_norms = np.einsum("ij,ij->i", matrix, matrix).astype(np.float32)
+    codes, scale = quantize(matrix, quant) if quant else (None, None)
+    meta = {
+        "version": GALLERY_VERSION,
+        "dim": int(matrix.shape[1]),
+        "count": int(len(ids)),
+        "labels": names,
+        "checksum": _checksum(matrix, sq_norms, ids, codes, scale),
+    }
+    if quant:
+        meta["quant"] = quant
+    header = json.dumps(meta).encode("utf-8")
+
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(GALLERY_MAGIC + struct.pack("<I", len(header)) + header)
+        for arr in (matrix, sq_norms, ids, codes, scale):
+            if arr is None:
+                continue
+            f.write(b"\0" * (_align(f.tell()) - f.tell()))
+            f.write(_raw(arr))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return open_gallery(path)
+
+
+def open_gallery(path, verify: bool = False) -> Gallery:
+    path = Path(path)
+    with open(path, "rb") as f:
+        if f.read(len(GALLERY_MAGIC)) != GALLERY_MAGIC:
+            raise ValueError(f"{path} is not a gallery file")
+        (hlen,) = struct.unpack("<I", f.read(4))
+        header = json.loads(f.read(hlen))
+    if header["version"] != GALLERY_VERSION:
+        raise ValueError(f"Unsupported gallery version {header['version']}")
+
+    n, dim = header["count"], header["dim"]
+    off_matrix = _align(len(GALLERY_MAGIC) + 4 + hlen)
+    off_norms = _align(off_matrix + n * dim * 4)
+    off_ids = _align(off_norms + n * 4)
+    end = off_ids + n * 4
+    quant = header.get("quant")
+    if quant is not None and quant not in QUANT_KINDS:
+        raise ValueError(f"Unsupported gallery quantization {quant!r}")
+    code_type = np.dtype(np.float16 if quant == "float16" else np.int8)
+    if quant:
+        off_codes = _align(end)
+        end = off_codes + n * dim * code_type.itemsize
+    if quant == "int8":
+        off_scale = _align(end)
+        end = off_scale + dim * 4
+    if path.stat().st_size < end:
+        raise ValueError(f"{path} is truncated")
+
+    codes = scale = None
+    if n == 0:
+        matrix = np.empty((0, dim), dtype=np.float32)
+        sq_norms = np.empty(0, dtype=np.float32)
+        ids = np.empty(0, dtype=np.int32)
+        if quant:
+            codes = np.empty((0, dim), dtype=code_type)
+    else:
+        matrix = np.memmap(path, dtype=np.float32, mode="r", offset=off_matrix, shape=(n, dim))
+        sq_norms = np.memmap(path, dtype=np.float32, mode="r", offset=off_norms, shape=(n,))
+        ids = np.memmap(path, dtype=np.int32, mode="r", offset=off_ids, shape=(n,))
+        if quant:
+            codes = np.memmap(path, dtype=code_type, mode="r", offset=off_codes, shape=(n, dim))
+    if quant == "int8":
+        scale = np.fromfile(path, dtype=np.float32, count=dim, offset=off_scale)
+
+    gallery = Gallery(matrix, sq_norms, ids, header["labels"], checksum=header["checksum"],
+                      quant=quant, codes=codes, scale=scale)
+    if verify and not gallery.verify():
+        raise ValueError(f"{path} failed its checksum")
+    return gallery
+
+
+class GalleryMatcher:
+    """
+    Nearest-neighbour matcher over a fixed set of face encodings.
+
+    Encodings are kept in one contiguous float32 matrix, grouped by label, with
+    their squared norms precomputed. All faces of a frame are scored against the
+    gallery with a single matrix product instead of one Python-level pass each.
+    Built from a Gallery the memory-mapped arrays are used as-is, without a copy.
+
+    An optional IVFPQIndex (ann_index.py) trained on the same encodings replaces
+    the brute-force scan for very large galleries; its nprobe sets the search width.
+
+    With quantized codes (quant="float16"/"int8", or a quantized Gallery) the scan
+    reads the compact codes and only the rerank best candidates are re-scored
+    against the float32 rows, so labels and distances follow the exact values.
+    """
+
+    def __init__(self, encodings, labels, index=None, rerank: int = 32, quant: str | None = None):
+        matrix, ids, names, order = _group_by_label(encodings, labels)
+        sq_norms = np.einsum("ij,ij->i", matrix, matrix)
+        codes, scale = quantize(matrix, quant) if quant else (None, None)
+        self._setup(matrix, sq_norms, ids, names, order, index, rerank, codes, scale)
+
+    def _setup(self, matrix, sq_norms, label_ids, names, order, index, rerank, codes=None, scale=None):
+        self.matrix = matrix
+        self.sq_norms = sq_norms
+        self.label_ids = label_ids
+        self._names = names
+        self.codes = codes
+        self.scale = scale
+
+        # Rows are grouped by label, so per-identity minima are a single reduceat
+        starts = np.flatnonzero(np.r_[True, label_ids[1:] != label_ids[:-1]]) if len(label_ids) else []
+        self._starts = np.asarray(starts, dtype=np.intp)
+        self.label_names = [names[label_ids[i]] for i in self._starts]
+
+        self.rerank = rerank
+        self.index = None
+        if index is not None:
+            if index.ntotal != len(label_ids):
+                raise ValueError("ANN index does not match the gallery size; retrain it")
+            self.index = index
+            if order is not None:
+                # Point the index ids at our label-grouped rows
+                pos = np.empty(len(order), dtype=np.int64)
+                pos[order] = np.arange(len(order))
+                self.index = copy.copy(index)
+                self.index.ids = pos[index.ids]
+
+    @classmethod
+    def from_gallery(cls, gallery: Gallery, index=None, rerank: int = 32):
+        ids = np.asarray(gallery.label_ids)
+        if len(ids) > 1 and np.any(ids[1:] < ids[:-1]):
+            return cls(gallery.matrix, gallery.labels, index=index, rerank=rerank, quant=gallery.quant)
+        self = cls.__new__(cls)
+        self._setup(gallery.matrix, gallery.sq_norms, ids, gallery.label_names, None, index, rerank,
+                    gallery.codes, gallery.scale)
+        return self
+
+    @classmethod
+    def from_data(cls, known_data, index=None):
+        """Builds a matcher from what vision.load_encodings() returns (Gallery or legacy dict)."""
+        if isinstance(known_data, Gallery):
+            return cls.from_gallery(known_data, index=index)
+        return cls(known_data["encodings"], known_data["labels"], index=index)
+
+    def __len__(self):
+        return len(self.label_ids)
+
+    def with_nprobe(self, nprobe: int) -> "GalleryMatcher":
+        """Shallow copy sharing the gallery arrays whose ANN search probes nprobe cells."""
+        if self.index is None or self.index.nprobe == nprobe:
+            return self
+        other = copy.copy(self)
+        other.index = copy.copy(self.index)
+        other.index.nprobe = nprobe
+        return other
+
+    def label_of(self, row: int) -> str:
+        return self._names[self.label_ids[row]]
+
+    @property
+    def dim(self) -> int:
+        return self.matrix.shape[1]
+
+    def distances(self, queries) -> np.ndarray:
+        """Euclidean distances, shape (num_queries, len(gallery))."""
+        q = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        q_sq = np.einsum("ij,ij->i", q, q)
+        d2 = q_sq[:, None] + self.sq_norms[None, :] - 2.0 * (q @ self.matrix.T)
+        np.maximum(d2, 0.0, out=d2)
+        return np.sqrt(d2)
+
+    def match(self, queries, tolerance: float = 0.45) -> list[Match]:
+        """
+        Returns one Match per query.
+        label is 'Unknown' when the nearest encoding is farther than tolerance.
+        margin is the distance to the nearest other identity minus the best
+        distance (inf when the gallery holds a single identity).
+        """
+        if len(queries) == 0:
+            return []
+        if len(self) == 0:
+            return [Match("Unknown", float("inf"), float("inf")) for _ in range(len(queries))]
+        if self.index is not None:
+            return self._match_indexed(queries, tolerance)
+        if self.codes is not None:
+            return self._match_quantized(queries, tolerance)
+
+        per_label = np.minimum.reduceat(self.distances(queries), self._starts, axis=1)
+        best_idx = np.argmin(per_label, axis=1)
+        best = per_label[np.arange(len(per_label)), best_idx]
+        if per_label.shape[1] > 1:
+            second = np.partition(per_label, 1, axis=1)[:, 1]
+        else:
+            second = np.full(len(per_label), np.inf, dtype=per_label.dtype)
+
+        results = []
+        for i, d, s in zip(best_idx, best, second):
+            d = float(d)
+            label = self.label_names[i] if d <= tolerance else "Unknown"
+            results.append(Match(label, d, float(s) - d))
+        return results
+
+    def _approx_sq_distances(self, q) -> np.ndarray:
+        """Squared distances with the gallery side read from the quantized codes."""
+        n = len(self)
+        dots = np.empty((len(q), n), dtype=np.float32)
+        # Fold the int8 scale into the query instead of rescaling every row
+        qs = q * self.scale if self.scale is not None else q
+        for s in range(0, n, _QUANT_CHUNK):
+            block = self.codes[s:s + _QUANT_CHUNK].astype(np.float32)
+            np.matmul(qs, block.T, out=dots[:, s:s + _QUANT_CHUNK])
+        d2 = np.einsum("ij,ij->i", q, q)[:, None] + self.sq_norms[None, :] - 2.0 * dots
+        return d2
+
+    def _match_quantized(self, queries, tolerance):
+        q = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        d2 = self._approx_sq_distances(q)
+        k = min(max(1, self.rerank), len(self))
+        candidates = np.argpartition(d2, k - 1, axis=1)[:, :k]
+        # Also re-score the closest row of the runner-up identity, so the margin
+        # is exact even when all top-k candidates belong to one user
+        ends = np.r_[self._starts[1:], len(self)]
+        per_label = np.minimum.reduceat(d2, self._starts, axis=1)
+        top_labels = np.argsort(per_label, axis=1)[:, :2]
+
+        results = []
+        for qi, (qv, cand) in enumerate(zip(q, candidates)):
+            extra = [self._starts[j] + int(np.argmin(d2[qi, self._starts[j]:ends[j]])) for j in top_labels[qi]]
+            rows = np.unique(np.r_[cand, extra])
+            diff = np.asarray(self.matrix[rows], dtype=np.float32) - qv
+            dist = np.sqrt(np.einsum("ij,ij->i", diff, diff))
+            best = int(np.argmin(dist))
+            best_id = self.label_ids[rows[best]]
+            d = float(dist[best])
+            others = dist[self.label_ids[rows] != best_id]
+            other = float(others.min()) if len(others) else float("inf")
+            label = self._names[best_id] if d <= tolerance else "Unknown"
+            results.append(Match(label, d, other - d))
+        return results
+
+    def _match_indexed(self, queries, tolerance):
+        ids, dists = self.index.search(queries, self.matrix, k=self.rerank, rerank=self.rerank)
+        results = []
+        for row_ids, row_d in zip(ids, dists):
+            if row_ids[0] < 0:
+                results.append(Match("Unknown", float("inf"), float("inf")))
+                continue
+            best_label = self.label_of(row_ids[0])
+            d = float(row_d[0])
+            other = next(
+                (float(od) for i, od in zip(row_ids, row_d) if i >= 0 and self.label_of(i) != best_label),
+                float("inf"),
+            )
+            results.append(Match(best_label if d <= tolerance else "Unknown", d, other - d))
+        return results
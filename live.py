@@ -0,0 +1,126 @@
+from __future__ import annotations
+import threading
+import time
+
+
+class LatestFrameWorker:
+    """
+    Runs recognize(frame) on a background thread, always on the newest frame.
+
+    submit() never blocks: the mailbox holds one frame, and a frame still waiting
+    there when a newer one arrives is dropped, so work never queues up behind the
+    video. latest() returns the most recent results for drawing. on_result, if
+    given, is called on the worker thread with each new result list (attendance
+    writes go there, off the video callback).
+
+    The thread is started by the first submit() and exits after idle_timeout
+    seconds without frames or on stop(); the next submit() starts a new one, so
+    an abandoned session does not leave a thread behind.
+    """
+
+    def __init__(self, recognize, on_result=None, idle_timeout: float = 30.0):
+        self.recognize = recognize
+        self.on_result = on_result
+        self.idle_timeout = idle_timeout
+        self._cond = threading.Condition()
+        self._slot = None
+        self._results = []
+        self._result_received_at = None
+        self._thread = None
+        self._stop_event = None
+        self.last_error = None
+        self.counters = {
+            "frames_received": 0,
+            "frames_processed": 0,
+            "frames_dropped": 0,
+            "errors": 0,
+            "last_process_ms": 0.0,
+        }
+
+    def _start(self):
+        # Called with self._cond held
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(self._stop_event,),
+                                        name="recognition-worker", daemon=True)
+        self._thread.start()
+
+    @property
+    def running(self) -> bool:
+        with self._cond:
+            return self._thread is not None
+
+    def submit(self, frame):
+        with self._cond:
+            self.counters["frames_received"] += 1
+            if self._slot is not None:
+                self.counters["frames_dropped"] += 1
+            self._slot = (frame, time.monotonic())
+            if self._thread is None:
+                self._start()
+            self._cond.notify()
+
+    def latest(self):
+        with self._cond:
+            return self._results
+
+    def _run(self, stop_event):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.idle_timeout
+                while self._slot is None and not stop_event.is_set():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if stop_event.is_set() or self._slot is None:
+                    if self._thread is threading.current_thread():
+                        self._thread = None
+                    return
+                frame, received_at = self._slot
+                self._slot = None
+
+            t0 = time.perf_counter()
+            try:
+                results = self.recognize(frame)
+            except Exception as e:
+                with self._cond:
+                    self.counters["errors"] += 1
+                    self.last_error = repr(e)
+                continue
+
+            with self._cond:
+                if stop_event.is_set():
+                    return
+                self._results = results
+                self._result_received_at = received_at
+                self.counters["frames_processed"] += 1
+                self.counters["last_process_ms"] = (time.perf_counter() - t0) * 1000.0
+
+            if self.on_result is not None:
+                try:
+                    self.on_result(results)
+                except Exception as e:
+                    self.last_error = repr(e)
+
+    def stats(self) -> dict:
+        """Counters plus result_age_ms: how old the frame behind the drawn results is."""
+        with self._cond:
+            s = dict(self.counters)
+            ts = self._result_received_at
+        s["result_age_ms"] = (time.monotonic() - ts) * 1000.0 if ts is not None else None
+        s["last_error"] = self.last_error
+        s["running"] = self.running
+        return s
+
+    def stop(self):
+        """Stops the thread and drops the pending frame and last results; submit() restarts it."""
+        with self._cond:
+            thread, self._thread = self._thread, None
+            self._slot = None
+            self._results = []
+            self._result_received_at = None
+            if thread is None:
+                return
+            self._stop_event.set()
+            self._cond.notify_all()
+        thread.join(timeout=1.0)
@@ -0,0 +1,143 @@
+from __future__ import annotations
+import os
+import re
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+PROM_FILE = Path("reports/metrics.prom")
+PROM_PREFIX = "face_attendance_"
+
+_enabled = os.environ.get("FACE_ATTENDANCE_METRICS", "0") == "1"
+_lock = threading.Lock()
+_hists: dict[str, "Histogram"] = {}
+_counters: dict[str, float] = {}
+
+
+class Histogram:
+    """Rolling window of recent observations plus lifetime count and sum."""
+
+    def __init__(self, window: int = 2048):
+        self.values = deque(maxlen=window)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.values.append(value)
+        self.count += 1
+        self.sum += value
+
+    def percentiles(self, qs=(50, 95, 99)) -> dict:
+        vals = sorted(self.values)
+        if not vals:
+            return {q: None for q in qs}
+        return {q: vals[min(len(vals) - 1, int(round(q / 100 * (len(vals) - 1))))] for q in qs}
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def set_enabled(on: bool):
+    global _enabled
+    _enabled = bool(on)
+
+
+def reset():
+    with _lock:
+        _hists.clear()
+        _counters.clear()
+
+
+def observe(name: str, value: float):
+    if not _enabled:
+        return
+    with _lock:
+        h = _hists.get(name)
+        if h is None:
+            h = _hists[name] = Histogram()
+        h.observe(value)
+
+
+def inc(name: str, n: float = 1):
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+class _Timer:
+    __slots__ = ("name", "t0")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, (time.perf_counter() - self.t0) * 1000.0)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(name: str):
+    """with timer("vision.detect_ms"): ... records elapsed milliseconds; free when disabled."""
+    return _Timer(name) if _enabled else _NULL_TIMER
+
+
+def snapshot() -> dict:
+    """{"histograms": {name: {count, sum, p50, p95, p99}}, "counters": {name: value}}"""
+    with _lock:
+        hists = {}
+        for name, h in sorted(_hists.items()):
+            p = h.percentiles()
+            hists[name] = {"count": h.count, "sum": h.sum, "p50": p[50], "p95": p[95], "p99": p[99]}
+        return {"histograms": hists, "counters": dict(sorted(_counters.items()))}
+
+
+def _prom_name(name: str) -> str:
+    return PROM_PREFIX + re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+def to_prometheus() -> str:
+    """Prometheus text exposition: histograms as summaries over the rolling window."""
+    snap = snapshot()
+    lines = []
+    for name, h in snap["histograms"].items():
+        pname = _prom_name(name)
+        lines.append(f"# TYPE {pname} summary")
+        for q in ("p50", "p95", "p99"):
+            if h[q] is not None:
+                lines.append(f'{pname}{{quantile="0.{q[1:]}"}} {h[q]:.6g}')
+        lines.append(f"{pname}_sum {h['sum']:.6g}")
+        lines.append(f"{pname}_count {h['count']}")
+    for name, value in snap["counters"].items():
+        pname = _prom_name(name) + "_total"
+        lines.append(f"# TYPE {pname} counter")
+        lines.append(f"{pname} {value:.6g}")
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path=PROM_FILE) -> Path:
+    """Writes to_prometheus() atomically, e.g. for node_exporter's textfile collector."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(to_prometheus())
+    os.replace(tmp, path)
+    return path
@@ -0,0 +1,169 @@
+from __future__ import annotations
+import atexit
+import queue
+import sqlite3
+import threading
+import time
+from datetime import date, datetime
+
+from db import get_marked_user_ids, mark_attendance_batch
+
+
+class AttendanceRecorder:
+    """
+    Write-behind front end for attendance marking.
+
+    Keeps the set of users already marked today in memory (rebuilt from the DB at
+    startup and when the date rolls over), so repeat sightings never reach SQLite.
+    New marks are queued and a single writer thread inserts them in batched
+    transactions. close() (also registered with atexit) flushes what is queued.
+    With synchronous=True there is no writer thread and mark() writes inline,
+    as it also does after close(); an inline write that still fails after all
+    retries raises its sqlite3.Error.
+    """
+
+    def __init__(self, batch_size: int = 256, flush_interval: float = 0.5,
+                 synchronous: bool = False, retries: int = 3):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.synchronous = synchronous
+        self.retries = retries
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._day = None
+        self._marked = set()
+        self._closed = False
+        self.last_error = None
+        self.counters = {"marked": 0, "duplicates": 0, "written": 0, "batches": 0, "write_errors": 0}
+
+        with self._lock:
+            self._roll_day(date.today().isoformat())
+
+        self._thread = None
+        if not synchronous:
+            self._thread = threading.Thread(target=self._run, name="attendance-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def _roll_day(self, today: str):
+        # Caller holds self._lock
+        self._day = today
+        self._marked = {(uid, today) for uid in get_marked_user_ids(today)}
+
+    def mark(self, user_id: str, name: str) -> bool:
+        """Returns True if this is the user's first mark today, False if already marked."""
+        now = datetime.now()
+        today = now.date().isoformat()
+        with self._lock:
+            if today != self._day:
+                self._roll_day(today)
+            key = (user_id, today)
+            if key in self._marked:
+                self.counters["duplicates"] += 1
+                return False
+            self._marked.add(key)
+            self.counters["marked"] += 1
+            row = (user_id, name, today, now.strftime("%H:%M:%S"))
+            # Checked under the lock so a row never lands behind close()'s sentinel
+            inline = self.synchronous or self._closed
+            if not inline:
+                self._queue.put(row)
+        if inline:
+            self._write([row], raise_errors=True)
+        return True
+
+    def is_marked(self, user_id: str, att_date: str | None = None) -> bool:
+        with self._lock:
+            return (user_id, att_date or self._day) in self._marked
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Blocks until every queued mark has been written. Returns False on timeout."""
+        if self._thread is None:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            if self._thread is not None:
+                self._queue.put(None)
+        if self._thread is not None:
+            self._thread.join()
+
+    def _write(self, rows, raise_errors: bool = False):
+        error = None
+        for attempt in range(self.retries):
+            try:
+                written = mark_attendance_batch(rows)
+                with self._lock:
+                    self.counters["written"] += written
+                    self.counters["batches"] += 1
+                return
+            except sqlite3.Error as e:
+                error = e
+                self.last_error = repr(e)
+                time.sleep(0.05 * (2 ** attempt))
+
+        # Give up on this batch; forget the keys so the next sighting retries
+        with self._lock:
+            self.counters["write_errors"] += len(rows)
+            for user_id, _, att_date, _ in rows:
+                self._marked.discard((user_id, att_date))
+        if raise_errors and error is not None:
+            raise error
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch, stop = [], item is None
+            if not stop:
+                batch.append(item)
+            while len(batch) < self.batch_size and not stop:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                else:
+                    batch.append(item)
+
+            if batch:
+                self._write(batch)
+            for _ in range(len(batch) + (1 if stop else 0)):
+                self._queue.task_done()
+            if stop:
+                return
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self.counters)
+        s["pending"] = self.pending()
+        s["last_error"] = self.last_error
+        return s
+
+
+_recorder = None
+_recorder_lock = threading.Lock()
+
+
+def get_recorder() -> AttendanceRecorder:
+    """Process-wide recorder shared by every session and video callback."""
+    global _recorder
+    with _recorder_lock:
+        if _recorder is None:
+            _recorder = AttendanceRecorder()
+        return _recorder
@@ -0,0 +1,100 @@
+from __future__ import annotations
+import threading
+import time
+from typing import NamedTuple
+
+from gallery import GalleryMatcher
+from vision import GALLERY_FILE, INDEX_FILE, load_encodings, load_index
+
+
+class GallerySnapshot(NamedTuple):
+    version: int
+    matcher: GalleryMatcher
+    checksum: int | None
+    size: int
+    loaded_at: float
+
+
+def _file_sig(path):
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+class GalleryRegistry:
+    """
+    Process-wide, read-only gallery shared by every session and video callback.
+
+    current() returns an immutable GallerySnapshot; a caller that takes one
+    snapshot per frame matches the whole frame against the same gallery even if
+    a new one is swapped in meanwhile. New versions are picked up by reload()
+    (called after training) or, when another process rewrites gallery.bin or
+    the ANN index, by current() noticing the file change within check_interval
+    seconds. version increases by one per load.
+    """
+
+    def __init__(self, check_interval: float = 2.0):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._sig = None
+        self._checked_at = float("-inf")
+        self._version = 0
+
+    def current(self) -> GallerySnapshot | None:
+        snap = self._snapshot
+        if snap is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return snap
+        with self._lock:
+            if self._snapshot is None or self._files_sig() != self._sig:
+                try:
+                    self._load()
+                except (OSError, ValueError):
+                    # Half-written or unreadable files: keep serving the last good gallery
+                    if self._snapshot is None:
+                        raise
+            self._checked_at = time.monotonic()
+            return self._snapshot
+
+    def reload(self) -> GallerySnapshot | None:
+        with self._lock:
+            self._load()
+            self._checked_at = time.monotonic()
+            return self._snapshot
+
+    @staticmethod
+    def _files_sig():
+        return _file_sig(GALLERY_FILE), _file_sig(INDEX_FILE)
+
+    def _load(self):
+        # Caller holds self._lock. Readers keep using the old snapshot until the
+        # single assignment below publishes the new one.
+        sig = self._files_sig()
+        known = load_encodings()
+        if known is None:
+            self._snapshot, self._sig = None, sig
+            return
+        index = load_index()
+        if index is not None and index.ntotal != len(known):
+            index = None
+        matcher = GalleryMatcher.from_data(known, index=index)
+        self._version += 1
+        self._sig = sig
+        self._snapshot = GallerySnapshot(
+            self._version, matcher, getattr(known, "checksum", None), len(matcher), time.time()
+        )
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> GalleryRegistry:
+    """Process-wide gallery registry shared by every session and video callback."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = GalleryRegistry()
+        return _registry
@@ -0,0 +1,164 @@
+from __future__ import annotations
+import csv
+import io
+import os
+from datetime import date, timedelta
+from pathlib import Path
+
+from archive import archived_months, months_in_range, query_archive
+from db import cached_query, get_conn, iter_attendance
+
+REPORTS_DIR = Path("reports")
+CSV_HEADER = ("user_id", "name", "date", "time")
+
+
+def _range_clause(start: str | None, end: str | None):
+    """WHERE clause + params for an inclusive ISO date range; either bound may be None."""
+    conds, params = [], []
+    if start:
+        conds.append("att_date >= ?")
+        params.append(start)
+    if end:
+        conds.append("att_date <= ?")
+        params.append(end)
+    return (" WHERE " + " AND ".join(conds) if conds else ""), params
+
+
+@cached_query
+def count_present(att_date: str) -> int:
+    row = get_conn().execute("SELECT present FROM daily_headcount WHERE att_date=?", (att_date,)).fetchone()
+    return row[0] if row else 0
+
+
+@cached_query
+def count_users() -> int:
+    return get_conn().execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+
+@cached_query
+def daily_headcount(start: str | None = None, end: str | None = None):
+    """[(att_date, present), ...] newest first, from the daily_headcount rollup."""
+    where, params = _range_clause(start, end)
+    return get_conn().execute(
+        f"SELECT att_date, present FROM daily_headcount{where} ORDER BY att_date DESC",
+        params
+    ).fetchall()
+
+
+def _month_end(day: str) -> str:
+    first_of_next = (date.fromisoformat(day[:7] + "-01") + timedelta(days=32)).replace(day=1)
+    return (first_of_next - timedelta(days=1)).isoformat()
+
+
+def _month_split(start: str | None, end: str | None):
+    """
+    Splits an inclusive date range into whole months ('YYYY-MM' bounds, None =
+    open) and the date ranges of the partial months at its edges.
+    Returns (first_month, last_month, partial_ranges); there is no whole month
+    when first_month > last_month.
+    """
+    first = start[:7] if start else None
+    last = end[:7] if end else None
+    partial = []
+    if start and start[8:] != "01":
+        partial.append((start, min(_month_end(start), end) if end else _month_end(start)))
+        first = (date.fromisoformat(_month_end(start)) + timedelta(days=1)).strftime("%Y-%m")
+    if end and end != _month_end(end):
+        if not (partial and start[:7] == end[:7]):
+            partial.append((max(end[:7] + "-01", start) if start else end[:7] + "-01", end))
+        last = (date.fromisoformat(end[:7] + "-01") - timedelta(days=1)).strftime("%Y-%m")
+    return first, last, partial
+
+
+@cached_query
+def user_month_summary(start: str | None = None, end: str | None = None):
+    """
+    [(user_id, name, month 'YYYY-MM', days_present), ...].
+    Whole months come from the user_month_counts rollup; only the partial months
+    at the edges of the range are counted from the attendance rows (archives included).
+    """
+    first, last, partial = _month_split(start, end)
+    conn = get_conn()
+    conds, params = [], []
+    if first:
+        conds.append("month >= ?")
+        params.append(first)
+    if last:
+        conds.append("month <= ?")
+        params.append(last)
+    rows = []
+    if not (first and last and first > last):
+        where = " WHERE " + " AND ".join(conds) if conds else ""
+        rows += conn.execute(
+            f"SELECT user_id, name, month, days_present FROM user_month_counts{where}", params
+        ).fetchall()
+    for lo, hi in partial:
+        counts = {}
+        for chunk in iter_attendance(lo, hi):
+            for uid, name, att_date, _ in chunk:
+                prev_name, n = counts.get(uid, (name, 0))
+                counts[uid] = (max(prev_name, name), n + 1)
+        rows += [(uid, name, lo[:7], n) for uid, (name, n) in counts.items()]
+    rows.sort(key=lambda r: r[0])
+    rows.sort(key=lambda r: r[2], reverse=True)
+    return rows
+
+
+def iter_attendance_csv(start: str | None = None, end: str | None = None, chunk_rows: int = 5000):
+    """
+    Yields the attendance CSV for a range as encoded chunks of chunk_rows rows
+    (db.iter_attendance, archives included), so memory stays flat however long
+    the history is.
+    """
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    writer.writerow(CSV_HEADER)
+    for rows in iter_attendance(start, end, chunk_rows):
+        writer.writerows(rows)
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+
+def range_fingerprint(start: str | None = None, end: str | None = None) -> str:
+    """
+    Changes whenever a row in the range is added, removed or rewritten (rows are
+    insert-only). Archived rows keep their ids, so archiving leaves it unchanged.
+    """
+    where, params = _range_clause(start, end)
+    totals = [get_conn().execute(f"SELECT COUNT(*), MAX(id), TOTAL(id) FROM attendance{where}", params).fetchone()]
+    for month in months_in_range(archived_months(), start, end):
+        totals += query_archive(month, "COUNT(*), MAX(id), TOTAL(id)", start, end)
+    n = sum(t[0] for t in totals)
+    max_id = max((t[1] for t in totals if t[1] is not None), default=None)
+    sum_id = sum(t[2] for t in totals)
+    return f"{n}:{max_id}:{sum_id:.0f}"
+
+
+def report_path(start: str | None, end: str | None) -> Path:
+    if start and start == end:
+        return REPORTS_DIR / f"attendance_{start}.csv"
+    return REPORTS_DIR / f"attendance_{start or 'begin'}_{end or 'latest'}.csv"
+
+
+def ensure_report(start: str | None = None, end: str | None = None):
+    """
+    Returns (path, regenerated). The CSV is streamed to disk only when the range's
+    fingerprint differs from the one recorded next to the cached file.
+    """
+    REPORTS_DIR.mkdir(parents=True, exist_ok=True)
+    path = report_path(start, end)
+    meta = path.with_name(path.name + ".fingerprint")
+    fp = range_fingerprint(start, end)
+    if path.exists() and meta.exists() and meta.read_text() == fp:
+        return path, False
+
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        for chunk in iter_attendance_csv(start, end):
+            f.write(chunk)
+    os.replace(tmp, path)
+    meta.write_text(fp)
+    return path, True
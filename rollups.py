@@ -0,0 +1,45 @@
+"""
+Maintenance for the attendance rollup tables (daily_headcount, user_month_counts).
+
+    python rollups.py check      # compare rollups with the attendance rows; exit 1 on mismatch
+    python rollups.py rebuild    # recompute them from the attendance rows
+
+Attendance rows are the attendance table plus the monthly archive files
+(archive.py), which keep counting towards the rollups after they leave the table.
+
+init_db() backfills the rollups the first time it creates them and triggers keep
+them current afterwards, so rebuild is only needed to repair a database that was
+edited by hand.
+"""
+from __future__ import annotations
+import argparse
+import sys
+import time
+
+from db import init_db, rebuild_rollups, check_rollups
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("command", choices=["check", "rebuild"])
+    ap.add_argument("--limit", type=int, default=20, help="mismatches to print")
+    args = ap.parse_args()
+
+    init_db()
+    t0 = time.perf_counter()
+    if args.command == "rebuild":
+        rebuild_rollups()
+        print(f"Rebuilt rollups in {time.perf_counter() - t0:.2f}s")
+        return
+
+    mismatches = check_rollups()
+    for table, key, rollup, raw in mismatches[:args.limit]:
+        print(f"{table} {key}: rollup={rollup} raw={raw}")
+    if mismatches:
+        print(f"{len(mismatches)} mismatches; run `python rollups.py rebuild`", file=sys.stderr)
+        sys.exit(1)
+    print(f"Rollups consistent ({time.perf_counter() - t0:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+from __future__ import annotations
+import threading
+from collections import deque
+
+# (resize factor, HOG upsample count), cheapest first. The detector sees the frame
+# at scale * 2**upsample of full resolution; for equal detector resolution a larger
+# resize with no upsampling is preferred (sharper input for the encoder too).
+LEVELS = (
+    (0.25, 0),
+    (0.5, 0),
+    (0.75, 0),
+    (1.0, 0),
+    (0.75, 1),
+    (1.0, 1),
+)
+
+
+def effective_scale(level) -> float:
+    scale, upsample = level
+    return scale * (2 ** upsample)
+
+
+class ScaleController:
+    """
+    Picks the detection resize factor and HOG upsample level per frame so that
+    detection + encoding stays within budget_ms.
+
+    Detection cost is modelled as ms per detector megapixel and encoding as ms per
+    face, both as moving averages fed by update(). choose() takes the most detailed
+    level predicted to fit the budget. When every recently seen face is large, it
+    drops to the cheapest level that still keeps the smallest of them above
+    min_face_px at the detector; every probe_every frames it looks again at full
+    budget so small faces at the back are not missed for long.
+    """
+
+    def __init__(self, budget_ms: float = 80.0, min_face_px: int = 80, probe_every: int = 15,
+                 alpha: float = 0.2, levels=LEVELS, start_level=(1.0, 0)):
+        self.budget_ms = budget_ms
+        self.min_face_px = min_face_px
+        self.probe_every = probe_every
+        self.alpha = alpha
+        self.levels = tuple(levels)
+        self.level = tuple(start_level) if tuple(start_level) in self.levels else self.levels[len(self.levels) // 2]
+        self._lock = threading.Lock()
+        self._ms_per_mp = None
+        self._ms_per_face = 0.0
+        self._faces = 0
+        self._face_heights = deque(maxlen=30)
+        self._frames = 0
+        self._last_pred = None
+
+    def _predict(self, level, frame_mp: float) -> float:
+        return self._ms_per_mp * frame_mp * effective_scale(level) ** 2 + self._ms_per_face * self._faces
+
+    def choose(self, frame_shape):
+        """Returns (scale, upsample) for a frame of the given shape."""
+        h, w = frame_shape[:2]
+        frame_mp = h * w / 1e6
+        with self._lock:
+            self._frames += 1
+            if self._ms_per_mp is None:
+                return self.level
+
+            fitting = [lv for lv in self.levels if self._predict(lv, frame_mp) <= self.budget_ms]
+            level = fitting[-1] if fitting else self.levels[0]
+
+            probing = self.probe_every and self._frames % self.probe_every == 0
+            seen = [fh for fh in self._face_heights if fh is not None]
+            if seen and not probing:
+                needed = self.min_face_px / min(seen)
+                enough = [lv for lv in fitting if effective_scale(lv) >= needed]
+                if enough:
+                    level = enough[0]
+
+            self.level = level
+            self._last_pred = self._predict(level, frame_mp)
+            return level
+
+    def update(self, frame_shape, level, detect_ms: float, encode_ms: float, face_heights):
+        """
+        Feeds back one frame: detection/encoding times for the level used and the
+        heights (full-resolution pixels) of the faces found.
+        """
+        h, w = frame_shape[:2]
+        detector_mp = h * w / 1e6 * effective_scale(level) ** 2
+        a = self.alpha
+        with self._lock:
+            k = detect_ms / max(detector_mp, 1e-6)
+            self._ms_per_mp = k if self._ms_per_mp is None else (1 - a) * self._ms_per_mp + a * k
+            n = len(face_heights)
+            if n:
+                self._ms_per_face = (1 - a) * self._ms_per_face + a * (encode_ms / n)
+            # Only the smallest face of a frame decides how much detail is needed
+            self._face_heights.append(min(face_heights) if n else None)
+            self._faces = n
+
+    def state(self) -> dict:
+        """Current choice and model, for the UI and metrics."""
+        with self._lock:
+            scale, upsample = self.level
+            seen = [fh for fh in self._face_heights if fh is not None]
+            return {
+                "scale": scale,
+                "upsample": upsample,
+                "effective_scale": effective_scale(self.level),
+                "budget_ms": self.budget_ms,
+                "predicted_ms": self._last_pred,
+                "detect_ms_per_mp": self._ms_per_mp,
+                "encode_ms_per_face": self._ms_per_face,
+                "smallest_recent_face_px": min(seen) if seen else None,
+            }
@@ -0,0 +1,240 @@
+"""
+Headless multi-stream recognition server.
+
+    python stream_server.py 0 1 rtsp://door-cam/stream        # cameras / URLs
+    python stream_server.py cctv/a.mp4 cctv/b.mp4 --realtime   # files standing in for cameras
+
+Each source gets a reader thread that decodes frames and submits them to one
+process pool sized to the cores. Workers open the memory-mapped gallery.bin, so
+every process reads the same page-cache copy of the gallery rather than its own,
+and a retrained gallery is picked up without a restart (registry.py).
+Recognised users go to a single AttendanceRecorder (one writer, one mark per user
+per day). Per-stream FPS and queue depth (frames in flight) are printed every
+--report-every seconds and as JSON when all sources end or on Ctrl-C.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import cv2
+
+from db import init_db, get_users
+from recorder import AttendanceRecorder
+from registry import get_registry
+from vision import load_encodings, recognize_from_frame
+
+_tolerance = 0.45
+
+
+def _init_worker(tolerance: float):
+    # Runs once per worker process; the gallery arrays are memory-mapped, not copied
+    global _tolerance
+    get_registry().current()
+    _tolerance = tolerance
+
+
+def _recognize(frame):
+    # The registry picks up a retrained gallery without restarting the server
+    matcher = get_registry().current().matcher
+    return sorted({label for label, _ in recognize_from_frame(frame, matcher, tolerance=_tolerance)} - {"Unknown"})
+
+
+def open_source(source: str):
+    """Integer strings are camera indices; anything else is a file path or URL."""
+    return cv2.VideoCapture(int(source) if source.isdigit() else source)
+
+
+class StreamReader(threading.Thread):
+    """
+    Decodes one source and keeps at most max_pending of its frames in the pool.
+
+    Live sources (cameras, or files with realtime=True, which are paced to their
+    FPS) drop a frame when the stream is already max_pending frames behind; plain
+    files wait instead, so every stride-th frame is recognised.
+    """
+
+    def __init__(self, name: str, source: str, pool, on_result, max_pending: int = 2,
+                 stride: int = 1, realtime: bool = False):
+        super().__init__(name=f"stream-{name}", daemon=True)
+        self.stream = name
+        self.source = source
+        self.pool = pool
+        self.on_result = on_result
+        self.stride = max(1, stride)
+        self.live = realtime or source.isdigit() or "://" in source
+        self.realtime = realtime
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._done_times = deque(maxlen=60)
+        self.started_at = None
+        self.finished = False
+        self.last_error = None
+        self.counters = {"frames_read": 0, "frames_submitted": 0, "frames_processed": 0,
+                         "frames_dropped": 0, "pending": 0, "errors": 0, "users_seen": 0}
+        self._seen = set()
+
+    def stop(self):
+        self._stopping.set()
+
+    def run(self):
+        cap = open_source(self.source)
+        self.started_at = time.monotonic()
+        try:
+            if not cap.isOpened():
+                self.last_error = f"could not open {self.source}"
+                return
+            fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+            idx = -1
+            while not self._stopping.is_set():
+                ok = cap.grab()
+                if not ok:
+                    break
+                idx += 1
+                if self.realtime:
+                    delay = self.started_at + idx / fps - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                if idx % self.stride:
+                    continue
+                ret, frame = cap.retrieve()
+                if not ret:
+                    continue
+                with self._lock:
+                    self.counters["frames_read"] += 1
+                if not self._slots.acquire(blocking=not self.live):
+                    with self._lock:
+                        self.counters["frames_dropped"] += 1
+                    continue
+                with self._lock:
+                    self.counters["frames_submitted"] += 1
+                    self.counters["pending"] += 1
+                self.pool.submit(_recognize, frame).add_done_callback(self._done)
+            # Let frames already in the pool finish before reporting the stream as done
+            while self.counters["pending"] and not self._stopping.is_set():
+                time.sleep(0.01)
+        finally:
+            cap.release()
+            self.finished = True
+
+    def _done(self, fut):
+        self._slots.release()
+        try:
+            labels = fut.result()
+        except Exception as e:
+            labels = []
+            self.last_error = repr(e)
+            with self._lock:
+                self.counters["errors"] += 1
+        with self._lock:
+            self.counters["pending"] -= 1
+            self.counters["frames_processed"] += 1
+            self._done_times.append(time.monotonic())
+            self._seen.update(labels)
+            self.counters["users_seen"] = len(self._seen)
+        if labels:
+            self.on_result(self.stream, labels)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            s = dict(self.counters)
+            times = list(self._done_times)
+        elapsed = now - self.started_at if self.started_at else 0.0
+        s["fps"] = s["frames_processed"] / elapsed if elapsed else 0.0
+        # Recent rate over the last completed frames, for long-running streams
+        s["fps_recent"] = (len(times) - 1) / (times[-1] - times[0]) if len(times) > 1 and times[-1] > times[0] else 0.0
+        s["finished"] = self.finished
+        s["last_error"] = self.last_error
+        return s
+
+
+def stream_names(sources):
+    names, seen = [], {}
+    for src in sources:
+        base = f"cam{src}" if src.isdigit() else (Path(src).stem or src)
+        seen[base] = seen.get(base, 0) + 1
+        names.append(base if seen[base] == 1 else f"{base}_{seen[base]}")
+    return names
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("sources", nargs="+", help="camera indices, video files or stream URLs")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="recognition processes shared by all streams")
+    ap.add_argument("--max-pending", type=int, default=2, help="frames in flight per stream before dropping/waiting")
+    ap.add_argument("--stride", type=int, default=1, help="recognise every Nth frame of each stream")
+    ap.add_argument("--realtime", action="store_true", help="pace files to their FPS and drop frames like a live camera")
+    ap.add_argument("--tolerance", type=float, default=0.45)
+    ap.add_argument("--report-every", type=float, default=5.0, help="seconds between stats lines (0 = only at the end)")
+    args = ap.parse_args()
+
+    init_db()
+    # Also migrates a legacy pickle before the workers open gallery.bin
+    if load_encodings() is None:
+        raise SystemExit("No gallery found; train first.")
+    names = {uid: nm for uid, nm, _ in get_users()}
+    recorder = AttendanceRecorder()
+    marks = {}
+    marks_lock = threading.Lock()
+
+    def on_result(stream, labels):
+        for uid in labels:
+            if recorder.mark(uid, names.get(uid, "Unknown Name")):
+                with marks_lock:
+                    marks[stream] = marks.get(stream, 0) + 1
+                print(f"[{stream}] marked {uid}", file=sys.stderr)
+
+    pool = ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(args.tolerance,))
+    readers = [
+        StreamReader(name, src, pool, on_result, max_pending=args.max_pending, stride=args.stride, realtime=args.realtime)
+        for name, src in zip(stream_names(args.sources), args.sources)
+    ]
+
+    def report():
+        out = {}
+        for r in readers:
+            s = r.stats()
+            with marks_lock:
+                s["marked"] = marks.get(r.stream, 0)
+            out[r.stream] = s
+        return out
+
+    t0 = time.monotonic()
+    try:
+        for r in readers:
+            r.start()
+        next_report = t0 + args.report_every
+        while any(r.is_alive() for r in readers):
+            time.sleep(0.2)
+            if args.report_every and time.monotonic() >= next_report:
+                next_report += args.report_every
+                line = "  ".join(f"{n}: {s['fps']:.1f} fps, depth {s['pending']}, dropped {s['frames_dropped']}"
+                                 for n, s in report().items())
+                print(line, file=sys.stderr)
+    except KeyboardInterrupt:
+        for r in readers:
+            r.stop()
+        for r in readers:
+            r.join()
+    finally:
+        pool.shutdown(cancel_futures=True)
+        recorder.close()
+
+    print(json.dumps({
+        "elapsed_sec": time.monotonic() - t0,
+        "workers": args.workers,
+        "streams": report(),
+        "recorder": recorder.stats(),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
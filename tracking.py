@@ -0,0 +1,182 @@
+from __future__ import annotations
+import itertools
+import time
+import cv2
+
+from vision import detect_faces, identify_faces, to_frame_coords
+
+# Template matching always runs on a half-size grayscale frame, whatever scale detection used
+TRACK_SCALE = 0.5
+
+
+def track_gray(frame_bgr):
+    small = cv2.resize(frame_bgr, (0, 0), fx=TRACK_SCALE, fy=TRACK_SCALE)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+
+def iou(a, b) -> float:
+    """Intersection over union of two (top, right, bottom, left) boxes."""
+    top, bottom = max(a[0], b[0]), min(a[2], b[2])
+    left, right = max(a[3], b[3]), min(a[1], b[1])
+    inter = max(0, bottom - top) * max(0, right - left)
+    area_a = (a[2] - a[0]) * (a[1] - a[3])
+    area_b = (b[2] - b[0]) * (b[1] - b[3])
+    union = area_a + area_b - inter
+    return inter / union if union > 0 else 0.0
+
+
+class Track:
+    _ids = itertools.count(1)
+
+    def __init__(self, box, label, distance, gray):
+        self.id = next(Track._ids)
+        self.label = label
+        self.distance = distance
+        self.lost = False
+        self.reset(box, gray)
+
+    def reset(self, box, gray):
+        # box is in full-frame coords; the template is cut from track_gray() of the same frame
+        self.box = tuple(int(v) for v in box)
+        top, right, bottom, left = (int(v * TRACK_SCALE) for v in self.box)
+        self.template = gray[max(0, top):bottom, max(0, left):right].copy()
+        self.lost = self.template.size == 0
+
+
+class FaceTracker:
+    """
+    Detect-every-N-frames recognizer for a single video stream.
+
+    Full HOG detection runs every detect_every frames, or on the next frame after a
+    track is lost. In between, each track's box is carried by template matching on
+    the half-size grayscale frame. An optional scaling.ScaleController picks the
+    detection scale. Detected boxes that overlap a track whose
+    identity is already confirmed keep that identity and are not re-encoded; only
+    new or still-Unknown faces go through encoding and matching.
+    """
+
+    def __init__(self, matcher, tolerance: float = 0.45, detect_every: int = 10,
+                 iou_threshold: float = 0.3, min_score: float = 0.5, controller=None):
+        self.matcher = matcher
+        self.controller = controller
+        self.version = None
+        self.tolerance = tolerance
+        self.detect_every = detect_every
+        self.iou_threshold = iou_threshold
+        self.min_score = min_score
+        self.tracks: list[Track] = []
+        self._since_detect = None
+        self.counters = {
+            "frames": 0,
+            "detect_frames": 0,
+            "track_frames": 0,
+            "faces_encoded": 0,
+            "encodes_skipped": 0,
+            "detect_cpu_s": 0.0,
+            "track_cpu_s": 0.0,
+        }
+
+    def set_matcher(self, matcher, version=None):
+        """
+        Swaps the matcher. When version (e.g. the gallery checksum) changes,
+        identities confirmed against the old gallery are dropped.
+        """
+        self.matcher = matcher
+        if version != self.version:
+            self.version = version
+            self.tracks = []
+            self._since_detect = None
+
+    def process(self, frame_bgr):
+        """Same return shape as vision.recognize_from_frame: [(label, box), ...] in frame coords."""
+        t0 = time.thread_time()
+        self.counters["frames"] += 1
+        need_detect = (
+            self._since_detect is None
+            or self._since_detect + 1 >= max(1, self.detect_every)
+            or any(t.lost for t in self.tracks)
+        )
+        if need_detect:
+            self._detect(frame_bgr)
+            self._since_detect = 0
+            self.counters["detect_frames"] += 1
+            self.counters["detect_cpu_s"] += time.thread_time() - t0
+        else:
+            self._track(frame_bgr)
+            self._since_detect += 1
+            self.counters["track_frames"] += 1
+            self.counters["track_cpu_s"] += time.thread_time() - t0
+
+        return [(t.label, t.box) for t in self.tracks if not t.lost]
+
+    def _detect(self, frame_bgr):
+        scale, upsample = self.controller.choose(frame_bgr.shape) if self.controller else (0.5, 1)
+        t0 = time.perf_counter()
+        rgb_small, boxes = detect_faces(frame_bgr, scale=scale, upsample=upsample)
+        t1 = time.perf_counter()
+        gray = track_gray(frame_bgr)
+
+        tracks = []
+        pending = []
+        free = [t for t in self.tracks if t.label != "Unknown"]
+        for box in boxes:
+            full = to_frame_coords(box, scale)
+            best = max(free, key=lambda t: iou(t.box, full), default=None)
+            if best is not None and iou(best.box, full) >= self.iou_threshold:
+                # Confirmed identity carried over; no encode needed
+                free.remove(best)
+                best.reset(full, gray)
+                tracks.append(best)
+                self.counters["encodes_skipped"] += 1
+            else:
+                pending.append((box, full))
+
+        t2 = time.perf_counter()
+        if pending:
+            matches = identify_faces(rgb_small, [b for b, _ in pending], self.matcher, tolerance=self.tolerance)
+            self.counters["faces_encoded"] += len(pending)
+            for (_, full), m in zip(pending, matches):
+                tracks.append(Track(full, m.label, m.distance, gray))
+        t3 = time.perf_counter()
+
+        if self.controller:
+            self.controller.update(frame_bgr.shape, (scale, upsample), (t1 - t0) * 1000.0, (t3 - t2) * 1000.0,
+                                   [t.box[2] - t.box[0] for t in tracks])
+        self.tracks = tracks
+
+    def _track(self, frame_bgr):
+        gray = track_gray(frame_bgr)
+        h_img, w_img = gray.shape
+
+        for t in self.tracks:
+            if t.lost:
+                continue
+            top, right, bottom, left = (int(v * TRACK_SCALE) for v in t.box)
+            h, w = t.template.shape
+            pad = max(h, w) // 2
+            y0, x0 = max(0, top - pad), max(0, left - pad)
+            y1, x1 = min(h_img, bottom + pad), min(w_img, right + pad)
+            window = gray[y0:y1, x0:x1]
+            if window.shape[0] < h or window.shape[1] < w:
+                t.lost = True
+                continue
+
+            res = cv2.matchTemplate(window, t.template, cv2.TM_CCOEFF_NORMED)
+            _, score, _, (dx, dy) = cv2.minMaxLoc(res)
+            if score < self.min_score:
+                t.lost = True
+                continue
+            t.box = to_frame_coords((y0 + dy, x0 + dx + w, y0 + dy + h, x0 + dx), TRACK_SCALE)
+
+    def stats(self) -> dict:
+        """Counters plus average CPU ms per detect/track frame and the estimated saving."""
+        c = dict(self.counters)
+        detect_ms = 1000 * c["detect_cpu_s"] / c["detect_frames"] if c["detect_frames"] else 0.0
+        track_ms = 1000 * c["track_cpu_s"] / c["track_frames"] if c["track_frames"] else 0.0
+        avg_ms = 1000 * (c["detect_cpu_s"] + c["track_cpu_s"]) / c["frames"] if c["frames"] else 0.0
+        c["detect_ms_per_frame"] = detect_ms
+        c["track_ms_per_frame"] = track_ms
+        c["avg_ms_per_frame"] = avg_ms
+        # Versus running full detection on every frame
+        c["cpu_saved_pct"] = 100.0 * (1 - avg_ms / detect_ms) if detect_ms else 0.0
+        return c
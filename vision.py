@@ -1,22 +1,86 @@
 from __future__ import annotations
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import cv2
 import numpy as np
 from pathlib import Path
 import pickle
-import face_recognition
+
+from gallery import Gallery, GalleryMatcher, Match, open_gallery, save_gallery
+from ann_index import IVFPQIndex
+from compaction import compact_gallery
+import metrics
 
 IMAGES_DIR = Path("data/images")
 ENC_DIR = Path("data/encodings")
-ENC_FILE = ENC_DIR / "encodings.pkl"
+ENC_FILE = ENC_DIR / "encodings.pkl"  # legacy pickle, read only to migrate
+GALLERY_FILE = ENC_DIR / "gallery.bin"
+INDEX_FILE = ENC_DIR / "ann_index.npz"
+MANIFEST_FILE = ENC_DIR / "manifest.pkl"
+
+def face_models():
+    """
+    Returns the face_recognition module, imported on first use. Importing it loads
+    the dlib models, so that cost is paid once per process and only by code that
+    detects or encodes faces.
+    """
+    import face_recognition
+    return face_recognition
 
 def ensure_dirs():
     IMAGES_DIR.mkdir(parents=True, exist_ok=True)
     ENC_DIR.mkdir(parents=True, exist_ok=True)
     Path("reports").mkdir(parents=True, exist_ok=True)
 
-def capture_images(user_id: str, num_images: int = 30, cam_index: int = 0):
+def crop_meta_path(img_path) -> Path:
+    """Sidecar written next to each captured crop: data/images/<user_id>/<name>.json"""
+    return Path(img_path).with_suffix(".json")
+
+def load_crop_meta(img_path, shape=None):
+    """
+    Returns the capture metadata of img_path, or None if there is none or it no
+    longer fits the image (shape = (h, w) of the decoded image, if known).
+    """
+    try:
+        meta = json.loads(crop_meta_path(img_path).read_text())
+        top, right, bottom, left = (int(v) for v in meta["box"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    if shape is not None:
+        h, w = shape[:2]
+        if list(meta.get("crop_size", ())) != [h, w] or not (0 <= top < bottom <= h and 0 <= left < right <= w):
+            return None
+    return meta
+
+def sharpness(gray) -> float:
+    """Variance of the Laplacian on a fixed-size copy; low values mean a blurry crop."""
+    return float(cv2.Laplacian(cv2.resize(gray, (128, 128)), cv2.CV_64F).var())
+
+def dhash(gray) -> int:
+    """64-bit difference hash; near-identical crops differ in only a few bits."""
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+def capture_images(user_id: str, num_images: int = 30, cam_index: int = 0, controller=None,
+                   min_sharpness: float = 40.0, min_hash_distance: int = 6,
+                   max_seconds: float = 120.0, stats: dict | None = None):
     """
     Captures num_images face images for a user and saves them.
+    controller (scaling.ScaleController) adapts the detection scale; default is half size.
+
+    A reader thread keeps only the newest camera frame, detection runs here, and
+    JPEGs are written by a background thread through a bounded queue. Crops with
+    sharpness() below min_sharpness, or within min_hash_distance bits of a crop
+    already kept, are skipped. Stops after max_seconds even if short of num_images.
+    If stats is a dict it is filled with frame/reject counts. Each crop gets a JSON
+    sidecar (crop_meta_path) with its face box and the detection scale used.
+    Only crops written successfully count; failed writes are replaced by new ones.
     Returns (saved_count, last_frame_rgb_for_preview)
     """
     user_folder = IMAGES_DIR / user_id
@@ -26,109 +90,392 @@ def capture_images(user_id: str, num_images: int = 30, cam_index: int = 0):
     if not cap.isOpened():
         raise RuntimeError("Could not open webcam. Try changing camera index.")
 
-    saved = 0
+    counts = {"frames_read": 0, "frames_detected": 0, "rejected_faces": 0,
+              "rejected_blur": 0, "rejected_duplicate": 0, "write_errors": 0, "written": 0}
+    stop = threading.Event()
+    frames = queue.Queue(maxsize=1)
+    writes = queue.Queue(maxsize=8)
+    # Exceptions from the reader/writer threads, re-raised here once they are joined
+    errors = []
+
+    def reader():
+        try:
+            while not stop.is_set():
+                ret, frame = cap.read()
+                if not ret:
+                    continue
+                counts["frames_read"] += 1
+                # Single producer: replace a frame detection has not picked up yet
+                try:
+                    frames.get_nowait()
+                except queue.Empty:
+                    pass
+                frames.put(frame)
+        except Exception as e:
+            errors.append(e)
+
+    def writer():
+        while True:
+            item = writes.get()
+            if item is None:
+                return
+            path, crop, meta = item
+            try:
+                if cv2.imwrite(str(path), crop):
+                    # The crop is the detected box, so training can skip detection (see encode_image)
+                    crop_meta_path(path).write_text(json.dumps(meta))
+                    counts["written"] += 1
+                else:
+                    counts["write_errors"] += 1
+            except Exception as e:
+                counts["write_errors"] += 1
+                errors.append(e)
+            finally:
+                writes.task_done()
+
+    threads = [threading.Thread(target=reader, daemon=True), threading.Thread(target=writer, daemon=True)]
+    for t in threads:
+        t.start()
+
+    queued = 0
     last_rgb = None
+    kept_hashes = []
+    deadline = time.monotonic() + max_seconds
 
     try:
-        while saved < num_images:
-            ret, frame = cap.read()
-            if not ret:
+        while time.monotonic() < deadline and not errors:
+            if queued - counts["write_errors"] >= num_images:
+                # Enough crops queued: wait for the writer, then replace any that failed
+                while writes.unfinished_tasks and time.monotonic() < deadline and not errors:
+                    time.sleep(0.01)
+                if counts["written"] >= num_images:
+                    break
                 continue
+            try:
+                frame = frames.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            counts["frames_detected"] += 1
 
-            # Resize for speed
-            small = cv2.resize(frame, (0, 0), fx=0.5, fy=0.5)
-            rgb_small = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
-
-            boxes = face_recognition.face_locations(rgb_small, model="hog")
-            # Draw boxes on original frame for feedback
-            for (top, right, bottom, left) in boxes:
-                top2, right2, bottom2, left2 = [v * 2 for v in (top, right, bottom, left)]
-                cv2.rectangle(frame, (left2, top2), (right2, bottom2), (0, 255, 0), 2)
+            scale, upsample = controller.choose(frame.shape) if controller else (0.5, 1)
+            t0 = time.perf_counter()
+            _, boxes = detect_faces(frame, scale=scale, upsample=upsample)
+            boxes = [to_frame_coords(b, scale) for b in boxes]
+            if controller:
+                controller.update(frame.shape, (scale, upsample), (time.perf_counter() - t0) * 1000.0, 0.0,
+                                  [bottom - top for top, _, bottom, _ in boxes])
 
             # Save only if exactly one face is found (clean dataset)
             if len(boxes) == 1:
-                # Crop face from original (higher res)
+                # Crop face from original (higher res) before drawing on it
                 (top, right, bottom, left) = boxes[0]
-                top2, right2, bottom2, left2 = [v * 2 for v in (top, right, bottom, left)]
-                face_crop = frame[max(0, top2):max(0, bottom2), max(0, left2):max(0, right2)]
+                face_crop = frame[max(0, top):max(0, bottom), max(0, left):max(0, right)].copy()
 
                 if face_crop.size > 0:
-                    out_path = user_folder / f"{user_id}_{saved+1:03d}.jpg"
-                    cv2.imwrite(str(out_path), face_crop)
-                    saved += 1
+                    gray = cv2.cvtColor(face_crop, cv2.COLOR_BGR2GRAY)
+                    h = dhash(gray)
+                    if sharpness(gray) < min_sharpness:
+                        counts["rejected_blur"] += 1
+                    elif any((h ^ k).bit_count() < min_hash_distance for k in kept_hashes):
+                        counts["rejected_duplicate"] += 1
+                    else:
+                        kept_hashes.append(h)
+                        queued += 1
+                        meta = {
+                            "box": [0, face_crop.shape[1], face_crop.shape[0], 0],
+                            "crop_size": list(face_crop.shape[:2]),
+                            "source_box": [int(top), int(right), int(bottom), int(left)],
+                            "source_shape": list(frame.shape[:2]),
+                            "source_scale": scale,
+                            "upsample": upsample,
+                        }
+                        writes.put((user_folder / f"{user_id}_{queued:03d}.jpg", face_crop, meta))
+            elif boxes:
+                counts["rejected_faces"] += 1
+
+            # Draw boxes on original frame for feedback
+            for (top, right, bottom, left) in boxes:
+                cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
 
             last_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
 
     finally:
+        stop.set()
+        writes.put(None)
+        for t in threads:
+            t.join()
         cap.release()
 
+    if errors:
+        raise errors[0]
+    saved = counts.pop("written")
+    if stats is not None:
+        stats.update(counts, saved=saved)
     return saved, last_rgb
 
-def train_encodings():
+def encode_image(img_path, use_crop_meta: bool = True):
+    """
+    Returns the encoding of the single face in img_path, or None if it has 0 or 2+ faces.
+    Crops saved by capture_images carry their face box (load_crop_meta), which is
+    used directly instead of running HOG detection again.
+    """
+    fr = face_models()
+    image = fr.load_image_file(str(img_path))
+    meta = load_crop_meta(img_path, image.shape) if use_crop_meta else None
+    if meta is not None:
+        return fr.face_encodings(image, [tuple(meta["box"])])[0]
+    return encode_rgb(image)[0]
+
+def encode_rgb(image):
+    """(encoding, faces_found) for an RGB array; encoding is None unless exactly one face was found."""
+    fr = face_models()
+    boxes = fr.face_locations(image, model="hog")
+    if len(boxes) != 1:
+        return None, len(boxes)
+    return fr.face_encodings(image, boxes)[0], 1
+
+def file_sha1(path: Path) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def atomic_pickle(obj, path: Path):
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        pickle.dump(obj, f)
+    os.replace(tmp, path)
+
+def load_manifest():
+    if not MANIFEST_FILE.exists():
+        return {}
+    with open(MANIFEST_FILE, "rb") as f:
+        return pickle.load(f)
+
+def _init_train_worker():
+    # Runs once per worker process so the models are loaded before the first image
+    face_models()
+
+def encode_images(paths, user_ids, workers: int = 1, progress=None, use_crop_meta: bool = True):
+    """
+    Encodes paths (see encode_image) and returns the results in input order.
+    With workers > 1 images are spread over a process pool; the output is identical
+    to the serial path. progress, if given, is called after every image with a dict:
+    done, total, images_per_sec, eta_sec and per_user {user_id: [done, total]}.
+    """
+    total = len(paths)
+    per_user = {}
+    for uid in user_ids:
+        per_user.setdefault(uid, [0, 0])[1] += 1
+    results = [None] * total
+    t0 = time.perf_counter()
+
+    def report(i, done):
+        per_user[user_ids[i]][0] += 1
+        if progress is not None:
+            rate = done / max(time.perf_counter() - t0, 1e-9)
+            progress({
+                "done": done,
+                "total": total,
+                "images_per_sec": rate,
+                "eta_sec": (total - done) / rate if rate > 0 else None,
+                "per_user": per_user,
+            })
+
+    if workers <= 1 or total < 2:
+        for i, p in enumerate(paths):
+            results[i] = encode_image(p, use_crop_meta)
+            report(i, i + 1)
+        return results
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_train_worker) as pool:
+        futures = {pool.submit(encode_image, str(p), use_crop_meta): i for i, p in enumerate(paths)}
+        for done, fut in enumerate(as_completed(futures), start=1):
+            i = futures[fut]
+            results[i] = fut.result()
+            report(i, done)
+    return results
+
+def train_encodings(build_index: bool = False, nlist: int | None = None, incremental: bool = False,
+                    workers: int | None = 1, progress=None, prototypes: int | None = None,
+                    quant: str | None = None):
     """
     Reads images from data/images/<user_id> and creates face encodings.
-    Saves to data/encodings/encodings.pkl
+    Saves to data/encodings/gallery.bin (see gallery.save_gallery)
+    With build_index=True also trains an IVF-PQ index saved to data/encodings/ann_index.npz
+    (nlist coarse cells, default 4*sqrt(N)); otherwise any old index is removed.
+    With incremental=True only images that are new or changed since the last run
+    (per data/encodings/manifest.pkl) are encoded; the rest are reused.
+    workers sets the encoding process count (None = all cores); progress is passed
+    to encode_images.
+    With prototypes=k each user is reduced to k medoid encodings plus an outlier
+    (compaction.compact_gallery); the manifest keeps every image's encoding.
+    quant ("float16" or "int8") also stores quantized codes that matching scans
+    (see gallery.save_gallery).
     Returns dict with stats.
     """
     ensure_dirs()
-    encodings = []
-    labels = []
+    workers = workers or os.cpu_count() or 1
+    old_manifest = load_manifest() if incremental else {}
+    manifest = {}
+    reused = 0
+    todo = []
 
-    user_folders = [p for p in IMAGES_DIR.iterdir() if p.is_dir()]
+    user_folders = sorted(p for p in IMAGES_DIR.iterdir() if p.is_dir())
     for uf in user_folders:
         user_id = uf.name
-        for img_path in uf.glob("*.jpg"):
-            image = face_recognition.load_image_file(str(img_path))
-            boxes = face_recognition.face_locations(image, model="hog")
-            if len(boxes) != 1:
-                continue
-            enc = face_recognition.face_encodings(image, boxes)[0]
-            encodings.append(enc)
-            labels.append(user_id)
+        for img_path in sorted(uf.glob("*.jpg")):
+            key = img_path.relative_to(IMAGES_DIR).as_posix()
+            info = img_path.stat()
+            entry = old_manifest.get(key)
+
+            if entry and entry["size"] == info.st_size and entry["mtime"] == info.st_mtime_ns:
+                reused += 1
+            else:
+                digest = file_sha1(img_path)
+                if entry and entry["sha1"] == digest:
+                    # Touched but unchanged content
+                    reused += 1
+                else:
+                    entry = {"encoding": None, "sha1": digest}
+                    todo.append((key, img_path, user_id))
+                entry = dict(entry, size=info.st_size, mtime=info.st_mtime_ns, user_id=user_id)
+            manifest[key] = entry
+
+    t0 = time.perf_counter()
+    new_encs = encode_images(
+        [p for _, p, _ in todo], [uid for _, _, uid in todo], workers=workers, progress=progress
+    )
+    encode_sec = time.perf_counter() - t0
+    known_crop = sum(crop_meta_path(p).exists() for _, p, _ in todo)
+    for (key, _, _), enc in zip(todo, new_encs):
+        # Rejected images (not exactly one face) are remembered with encoding=None
+        manifest[key]["encoding"] = enc
+
+    encodings = []
+    labels = []
+    for entry in manifest.values():
+        if entry["encoding"] is not None:
+            encodings.append(entry["encoding"])
+            labels.append(entry["user_id"])
+    images_used = len(encodings)
+    if prototypes and encodings:
+        encodings, labels = compact_gallery(encodings, labels, k=prototypes)
 
-    data = {"encodings": encodings, "labels": labels}
     ENC_DIR.mkdir(parents=True, exist_ok=True)
-    with open(ENC_FILE, "wb") as f:
-        pickle.dump(data, f)
+    gallery = save_gallery(GALLERY_FILE, encodings, labels, quant=quant)
+    atomic_pickle(manifest, MANIFEST_FILE)
 
-    return {
+    stats = {
         "users_found": len(user_folders),
-        "total_images_used": len(encodings),
-        "enc_file": str(ENC_FILE)
+        "total_images_used": images_used,
+        "gallery_size": len(labels),
+        "gallery_storage": quant or "float32",
+        "images_reused": reused,
+        "images_added": len(todo),
+        "images_removed": len(old_manifest.keys() - manifest.keys()),
+        "images_known_crop": known_crop,
+        "images_rejected": sum(enc is None for enc in new_encs),
+        "encode_sec": encode_sec,
+        "workers": workers,
+        "enc_file": str(GALLERY_FILE)
     }
+    write_index(gallery.matrix, build_index, nlist, stats)
+    return stats
+
+def write_index(encodings, build_index: bool, nlist: int | None, stats: dict):
+    # A stale index would point at the wrong rows, so drop it when not rebuilding
+    if build_index and len(encodings):
+        index = IVFPQIndex.train(encodings, nlist=nlist)
+        index.save(INDEX_FILE)
+        stats["index_file"] = str(INDEX_FILE)
+        stats["index_nlist"] = index.nlist
+    elif INDEX_FILE.exists():
+        INDEX_FILE.unlink()
 
-def load_encodings():
+def load_encodings() -> Gallery | None:
+    """
+    Opens the memory-mapped gallery. An old encodings.pkl is converted to
+    gallery.bin on first load.
+    """
+    if GALLERY_FILE.exists():
+        return open_gallery(GALLERY_FILE)
     if not ENC_FILE.exists():
         return None
     with open(ENC_FILE, "rb") as f:
-        return pickle.load(f)
+        data = pickle.load(f)
+    return save_gallery(GALLERY_FILE, data["encodings"], data["labels"])
+
+def load_index():
+    if not INDEX_FILE.exists():
+        return None
+    return IVFPQIndex.load(INDEX_FILE)
 
-def recognize_from_frame(frame_bgr, known_data, tolerance: float = 0.45):
+def detect_faces(frame_bgr, scale: float = 0.5, upsample: int = 1):
     """
-    Returns list of tuples: (user_id or 'Unknown', box)
-    box = (top, right, bottom, left) in original frame coords
+    Runs HOG detection on a copy of frame_bgr resized by scale, upsampling the
+    detector pyramid `upsample` times.
+    Returns (rgb_small, boxes) with boxes in rgb_small coords (see to_frame_coords).
     """
     # Smaller image for speed
-    small = cv2.resize(frame_bgr, (0, 0), fx=0.5, fy=0.5)
-    rgb_small = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+    with metrics.timer("vision.resize_ms"):
+        small = frame_bgr if scale == 1.0 else cv2.resize(frame_bgr, (0, 0), fx=scale, fy=scale)
+    with metrics.timer("vision.cvt_color_ms"):
+        rgb_small = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+    with metrics.timer("vision.detect_ms"):
+        boxes = face_models().face_locations(rgb_small, number_of_times_to_upsample=upsample, model="hog")
+    metrics.observe("vision.faces_per_frame", len(boxes))
+    return rgb_small, boxes
+
+def to_frame_coords(box, scale: float):
+    """Maps a (top, right, bottom, left) box from a frame resized by scale back to the original."""
+    return tuple(int(round(v / scale)) for v in box)
 
-    boxes = face_recognition.face_locations(rgb_small, model="hog")
-    encs = face_recognition.face_encodings(rgb_small, boxes)
+def identify_faces(rgb_small, boxes, known_data, tolerance: float = 0.45) -> list[Match]:
+    """Encodes the given boxes of rgb_small and matches them; one Match per box."""
+    with metrics.timer("vision.encode_ms"):
+        encs = face_models().face_encodings(rgb_small, boxes)
+
+    matcher = known_data
+    if known_data and not isinstance(known_data, GalleryMatcher):
+        matcher = GalleryMatcher.from_data(known_data)
+
+    if matcher and encs:
+        # One batched distance computation for every face in the frame
+        with metrics.timer("vision.match_ms"):
+            matches = matcher.match(encs, tolerance=tolerance)
+        if metrics.enabled():
+            for m in matches:
+                metrics.observe("vision.match_distance", m.distance)
+                metrics.inc("vision.faces_unknown" if m.label == "Unknown" else "vision.faces_recognized")
+        return matches
+    return [Match("Unknown", float("inf"), float("inf")) for _ in encs]
+
+def recognize_from_frame(frame_bgr, known_data, tolerance: float = 0.45, controller=None):
+    """
+    Returns list of tuples: (user_id or 'Unknown', box)
+    box = (top, right, bottom, left) in original frame coords
+    known_data is either the Gallery from load_encodings() or a prebuilt GalleryMatcher.
+    controller (scaling.ScaleController) picks the detection scale per frame; without
+    one frames are detected at half size with one upsample, as before.
+    """
+    scale, upsample = controller.choose(frame_bgr.shape) if controller else (0.5, 1)
+    with metrics.timer("vision.recognize_ms"):
+        t0 = time.perf_counter()
+        rgb_small, boxes = detect_faces(frame_bgr, scale=scale, upsample=upsample)
+        t1 = time.perf_counter()
+        matches = identify_faces(rgb_small, boxes, known_data, tolerance=tolerance)
+        t2 = time.perf_counter()
+    metrics.inc("vision.frames")
 
     results = []
-    for enc, (top, right, bottom, left) in zip(encs, boxes):
-        top2, right2, bottom2, left2 = [v * 2 for v in (top, right, bottom, left)]
-
-        name = "Unknown"
-        if known_data and known_data["encodings"]:
-            matches = face_recognition.compare_faces(known_data["encodings"], enc, tolerance=tolerance)
-            if True in matches:
-                # Pick best match by distance
-                dists = face_recognition.face_distance(known_data["encodings"], enc)
-                best_idx = int(np.argmin(dists))
-                if matches[best_idx]:
-                    name = known_data["labels"][best_idx]
-
-        results.append((name, (top2, right2, bottom2, left2)))
+    for m, box in zip(matches, boxes):
+        results.append((m.label, to_frame_coords(box, scale)))
+
+    if controller:
+        controller.update(frame_bgr.shape, (scale, upsample), (t1 - t0) * 1000.0, (t2 - t1) * 1000.0,
+                          [bottom - top for _, (top, _, bottom, _) in results])
+        metrics.observe("vision.detect_scale", scale * 2 ** upsample)
 
     return results